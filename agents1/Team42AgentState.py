@@ -100,8 +100,7 @@ class ExploringRoomState(Team42AgentState):
 
         # if we tried to grab a block previous tick, check if we have actually received it from god.
         if self.pending_block is not None:
-            res = state.get_with_property({'carried_by': map_state.agent_id})
-            if res is not None and self.pending_block[2]['id'] in [x['obj_id'] for x in res['is_carrying']]:
+            if self.pending_block[2].id in map_state.perceived.carried:
                 self.agent.grab_block(self.pending_block)
                 map_state.pop_block(self.pending_block[2])
             self.pending_block = None
@@ -126,7 +125,7 @@ class ExploringRoomState(Team42AgentState):
         # check if the blocks in the room has been visited if so change traverse strategy
         if map_state.are_nearby_blocks_visited():
             map_state.visit_room(self.room_id)
-            nearby_agents = map_state.get_nearby_agent(state)
+            nearby_agents = map_state.get_nearby_agent(map_state.perceived)
             ability = map_state.agent_ability
 
             def switch_traverse_order(self):
@@ -148,15 +147,15 @@ class ExploringRoomState(Team42AgentState):
         for block in filter(lambda b: not b[3], matching_blocks):
             # if we're too far away, temporarily set new destination to get closer to the block and pick it up
             # TODO extract hardcoded distance
-            if utils.get_distance(map_state.get_agent_location(), block[2]['location']) > 1:
+            if utils.get_distance(map_state.get_agent_location(), block[2].location) > 1:
                 self.navigator.reset_full()
-                self.navigator.add_waypoint(block[2]['location'])
+                self.navigator.add_waypoint(block[2].location)
                 return self.navigator.get_move_action(self.state_tracker), {}
 
             # otherwise grab this block
             self.navigator.is_done = True
             self.pending_block = block
-            return GrabObject.__name__, {'object_id': block[2]['id']}
+            return GrabObject.__name__, {'object_id': block[2].id}
 
         # # if full capacity, start delivering
         # # TODO make this smarter by cooperating with other agents
@@ -219,18 +218,18 @@ class DeliveringState(Team42AgentState):
             next_goal = map_state.get_next_drop_zone()
 
             # for testing reordering
-            # if "normal" not in map_state.agent_id and self.delivering_block[2]['id'] not in next_goal['found_blocks']:
+            # if "normal" not in map_state.agent_id and self.delivering_block[2].id not in next_goal.found_blocks:
             #     return None, {}
 
             # check if the next block to deliver is already delivered
-            if next_goal['priority'] > self.delivering_block[0]:
+            if next_goal.priority > self.delivering_block[0]:
                 # we don't actually drop this block, but we ignore it within the agent
                 self.agent.drop_block(self.delivering_block)
                 self.delivering_block = None
                 return self.process(map_state, state)
 
             # if our block is not the next to deliver, wait
-            if self.delivering_block[2]['id'] not in next_goal['found_blocks']:
+            if self.delivering_block[2].id not in next_goal.found_blocks:
                 return None, {}
 
             self.navigator.reset_full()
@@ -238,7 +237,7 @@ class DeliveringState(Team42AgentState):
             drop_block = {'location': self.delivering_block[1], 'block': self.delivering_block[2]}
             map_state.drop_block(drop_block)
             self.delivering_block = None
-            return DropObject.__name__, {'object_id': drop_block['block']['id']}
+            return DropObject.__name__, {'object_id': drop_block['block'].id}
 
         return self.navigator.get_move_action(self.state_tracker), {}
 
@@ -270,7 +269,7 @@ class WaitingState(Team42AgentState):
 
         mismatch = map_state.get_mismatched_spots()
         # if we have more than one mismatched block and if all blocks have been delivered (yet the game hasn't ended)
-        if len(mismatch) > 0 or sum([1 for goal_block in map_state.goal_blocks if goal_block['filled']]) == 3:
+        if len(mismatch) > 0 or sum([1 for goal_block in map_state.goal_blocks if goal_block.filled]) == 3:
             next_state = ReorderingState(self.strategy, self.navigator, self.state_tracker)
             self.agent.change_state(next_state)
             return next_state.process(map_state, state)
@@ -289,13 +288,12 @@ class ReorderingState(Team42AgentState):
 
         # if we tried to grab a block previous tick, check if we have actually received it from god.
         if self.pending_goal is not None:
-            res = state.get_with_property({'carried_by': map_state.agent_id})
-            if res is not None and self.pending_goal['filled']['id'] in [x['obj_id'] for x in res['is_carrying']]:
-                goal_id = self.pending_goal['filled']['id']
+            if self.pending_goal.filled.id in map_state.perceived.carried:
+                goal_id = self.pending_goal.filled.id
                 self.agent.grab_block([
-                    self.pending_goal['priority'],  # priority(order)
-                    self.pending_goal['location'],
-                    self.pending_goal['filled'],
+                    self.pending_goal.priority,  # priority(order)
+                    self.pending_goal.location,
+                    self.pending_goal.filled,
                     True if goal_id in map_state.carried_blocks.keys() else False])
                 map_state.pop_block(goal_id)
             else:
@@ -305,11 +303,11 @@ class ReorderingState(Team42AgentState):
         # pickup all blocks and redeliver them
         if self.remaining is None:
             self.remaining = [goal_block.copy() for goal_block in map_state.goal_blocks if
-                              goal_block['filled'] is not None]
+                              goal_block.filled is not None]
             self.remaining.sort(key=lambda goal_block:
-            utils.get_distance(map_state.get_agent_location(), goal_block['location']))
+            utils.get_distance(map_state.get_agent_location(), goal_block.location))
             for i, goal_block in enumerate(self.remaining):
-                self.remaining[i]['filled'] = map_state.blocks.get(goal_block['filled'])
+                self.remaining[i].filled = map_state.blocks.get(goal_block.filled)
 
         # pickup all blocks
         while len(self.remaining) > 0:
@@ -317,16 +315,16 @@ class ReorderingState(Team42AgentState):
 
             # if we're too far away, temporarily set new destination to get closer to the block and pick it up
             # TODO extract hardcoded distance
-            if utils.get_distance(map_state.get_agent_location(), goal_block['location']) > 1:
+            if utils.get_distance(map_state.get_agent_location(), goal_block.location) > 1:
                 if len(self.navigator.get_all_waypoints()) == 0 or self.navigator.is_done:
                     self.navigator.reset_full()
-                    self.navigator.add_waypoint(goal_block['location'])
+                    self.navigator.add_waypoint(goal_block.location)
                 return self.navigator.get_move_action(self.state_tracker), {}
 
             # otherwise grab this block
             self.pending_goal = goal_block
             self.remaining.remove(goal_block)
-            return GrabObject.__name__, {'object_id': goal_block['filled']['id']}
+            return GrabObject.__name__, {'object_id': goal_block.filled.id}
 
         next_state = DeliveringState(self.strategy, self.navigator, self.state_tracker)
         self.agent.change_state(next_state)
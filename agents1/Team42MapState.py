@@ -1,8 +1,12 @@
+import itertools
 import operator
 
 import matrx.utils
 from matrx.messages import Message
 
+from agents1.Team42Records import Block, DropSpot
+from agents1.Team42StateBuckets import StateBuckets
+
 
 class MapState:
     '''
@@ -14,28 +18,27 @@ class MapState:
 
     def __init__(self, state):
         '''
-        block = {
-            'id' : (string)unique id of the block. Can be used to distinguish different blocks.
-            'location': (x, y) location of the block
-            'room': room_x room name in where the block resides
-            'shape': 0|1|2 shape of the block(could be None)
-            'colour': (string) colour of the block(could be None)
-            'visited': The block will be marked as visited(3) when both the shape info and the colour
-                info have been discovered. Otherwise, this attribute has value 1 for having shape info only,
-                and 2 for having colour info only.
-            'is_collectable': this attribute is mainly used to distinguish ghost_blocks from normal block. When a ghost
-                is discovered, it only updates the drop_zone information and leave the blocks alone.
-        }
-
+        The blocks are kept as Block records and the drop spots in self.goal_blocks as DropSpot records,
+        see Team42Records. Blocks are only made from the dicts of the state and the messages, in _parse_blocks.
+        Messages carry those dicts or block ids, never records.
         '''
         self.message_queue = []  # message to be sent
         self.agent_id = state.get_self()['obj_id']  # id of the agent
+        self.perceived = StateBuckets(state, self.agent_id)  # the classified state of the last update_map
         self.blocks = {}  # all the blocks that has been discovered by the agents exclude the ones that is carried by agents.
         self.carried_blocks = {}  # the blocks that have been confiremed carried by the agent
+        self._match_index = {}  # (shape, colour) -> ids of the visited(3) blocks in self.blocks with those
+        self._shape_only = {}  # shape -> ids of the visited(1) blocks in self.blocks with that shape
+        self._colour_only = {}  # colour -> ids of the visited(2) blocks in self.blocks with that colour
+        self._indexed = {}  # block id -> (index, key) the block is in
+        self._goal_colours = None  # cached result of _get_goal_colour_set, None when it must be recomputed
+        self._goal_shapes = None  # cached result of _get_goal_shape_set
+        self._block_order = {}  # block id -> when it was last put into self.blocks, to keep its order
+        self._order = itertools.count()
         self.team_members = {}
         self.agent_location = None
         self._queue_message('Hello', None)
-        self._get_drop_zone(state)  # retrieve the information about drop zone
+        self._get_drop_zone(self.perceived)  # retrieve the information about drop zone
         self._get_rooms(state)  # retrieve the map information
         self.received_blocks = {}
         self.agent_ability = None
@@ -56,11 +59,13 @@ class MapState:
                 ghost_blocks_parsed = self._parse_blocks(ghost_blocks)
             for ghost_block in ghost_blocks_parsed:
                 for drop_spot in self.goal_blocks:
-                    if ghost_block['location'] == drop_spot['location']:
-                        if ghost_block['colour'] is not None:
-                            drop_spot['properties']['colour'] = ghost_block['colour']
-                        if ghost_block['shape'] is not None:
-                            drop_spot['properties']['shape'] = ghost_block['shape']
+                    if ghost_block.location == drop_spot.location:
+                        if ghost_block.colour is not None and drop_spot.colour != ghost_block.colour:
+                            drop_spot.colour = ghost_block.colour
+                            self._goals_changed()
+                        if ghost_block.shape is not None and drop_spot.shape != ghost_block.shape:
+                            drop_spot.shape = ghost_block.shape
+                            self._goals_changed()
 
     def _extract_room(self, room):
         '''
@@ -78,10 +83,10 @@ class MapState:
         only has colour = 2
         visited = 3
         '''
-        has_shape = (is_parsed and (block['shape'] is not None)) or \
+        has_shape = (is_parsed and (block.shape is not None)) or \
                     (not is_parsed and 'shape' in block['visualization'].keys())
 
-        has_color = (is_parsed and (block['colour'] is not None)) or \
+        has_color = (is_parsed and (block.colour is not None)) or \
                     (not is_parsed and 'colour' in block['visualization'].keys())
 
         return (has_color << 1) | has_shape
@@ -93,7 +98,7 @@ class MapState:
         res = []
         for block in blocks:
             # if it's a goal block
-            if not block['is_collectable']:
+            if not block.is_collectable:
                 self._update_ghost_block([block], True)
                 continue
             # if it's a normal block
@@ -101,13 +106,14 @@ class MapState:
 
             for drop_spot in self.goal_blocks:
                 # if the block discovered is in the drop zone then update the drop_zone
-                if to_be_updated['location'] == drop_spot['location']:
-                    if to_be_updated['is_collectable']:
-                        drop_spot['filled'] = to_be_updated['id']
+                if to_be_updated.location == drop_spot.location:
+                    if to_be_updated.is_collectable:
+                        self._fill_drop_spot(drop_spot, to_be_updated.id)
                     else:
                         self._update_ghost_block([to_be_updated], True)
 
-            self.blocks[block['id']] = to_be_updated  # only update the blocks when the block is collectable
+            self.blocks[block.id] = to_be_updated  # only update the blocks when the block is collectable
+            self._index_block(to_be_updated)
             if updated:
                 res.append(to_be_updated)  # return list of updated blocks
 
@@ -115,6 +121,77 @@ class MapState:
         if len(res) > 0:
             return res
 
+    def _index_block(self, block):
+        '''
+        Put a block that was (re)inserted into self.blocks in the index of its visited status:
+        the match index if it is fully visited, else the bucket of its known shape or colour.
+        '''
+        self._unindex_block(block.id)
+        self._block_order[block.id] = next(self._order)
+        visited = block.visited
+        if visited == 3:
+            index, key = self._match_index, (block.shape, block.colour)
+        elif visited == 1:
+            index, key = self._shape_only, block.shape
+        elif visited == 2:
+            index, key = self._colour_only, block.colour
+        else:
+            return
+        index.setdefault(key, {})[block.id] = None
+        self._indexed[block.id] = (index, key)
+
+    def _unindex_block(self, block_id):
+        '''
+        Remove a block from its index.
+        '''
+        indexed = self._indexed.pop(block_id, None)
+        if indexed is not None:
+            index, key = indexed
+            index[key].pop(block_id, None)
+
+    def _fill_drop_spot(self, drop_spot, block_id):
+        '''
+        Mark the drop spot as filled with the block.
+        '''
+        if drop_spot.filled != block_id:
+            drop_spot.filled = block_id
+            self._goals_changed()
+
+    def _known_block(self, raw_block):
+        '''
+        Compare the fingerprint of a block the agent perceives (id, location and the visible shape and colour)
+        with what we know of it.
+        @return the block in self.blocks if the perceived block tells nothing new about it, else None
+        '''
+        block = self.blocks.get(raw_block['obj_id'])
+        if block is None or block.location != raw_block['location']:
+            return None
+        visualization = raw_block['visualization']
+        if 'shape' in visualization and visualization['shape'] != block.shape:
+            return None
+        if 'colour' in visualization and visualization['colour'] != block.colour:
+            return None
+        return block
+
+    def _is_known_ghost_block(self, raw_block):
+        '''
+        @return true if the perceived ghost block tells nothing new about the drop spots
+        '''
+        drop_spot = self._drop_spots.get(raw_block['location'])
+        if drop_spot is None:
+            return True
+        visualization = raw_block['visualization']
+        return ('colour' not in visualization or visualization['colour'] == drop_spot.colour) and \
+               ('shape' not in visualization or visualization['shape'] == drop_spot.shape)
+
+    def _goals_changed(self):
+        '''
+        Forget the cached goal colour and shape sets. Must be called when a drop spot is (un)filled
+        or its properties change.
+        '''
+        self._goal_colours = None
+        self._goal_shapes = None
+
     def _blocks_to_message_format(self, blocks):
         '''
         raw blocks to message format
@@ -132,22 +209,22 @@ class MapState:
         return res
 
     def _update_collectable_blocks(self, blocks_container, candidate):
-        to_be_updated = blocks_container.pop(candidate['id'], None)  # check if the block is already in the collection
+        to_be_updated = blocks_container.pop(candidate.id, None)  # check if the block is already in the collection
         updated = False
         if to_be_updated is None:  # add new entry into the collection
             to_be_updated = candidate
             updated = True
         else:  # update shape, colour and status of the block if the block is in the collection
-            if to_be_updated['location'] != candidate['location']:
-                to_be_updated['location'] = candidate['location']
+            if to_be_updated.location != candidate.location:
+                to_be_updated.location = candidate.location
                 updated = True
-            if candidate['shape'] is not None and to_be_updated['shape'] != candidate['shape']:
-                to_be_updated['shape'] = candidate['shape']
+            if candidate.shape is not None and to_be_updated.shape != candidate.shape:
+                to_be_updated.shape = candidate.shape
                 updated = True
-            if candidate['colour'] is not None and to_be_updated['colour'] != candidate['colour']:
-                to_be_updated['colour'] = candidate['colour']
+            if candidate.colour is not None and to_be_updated.colour != candidate.colour:
+                to_be_updated.colour = candidate.colour
                 updated = True
-            to_be_updated['visited'] = self._get_block_status(to_be_updated, True)
+            to_be_updated.visited = self._get_block_status(to_be_updated, True)
         return updated, to_be_updated
 
     def _queue_message(self, type, data):
@@ -165,7 +242,7 @@ class MapState:
                 'agent_id': self.agent_id,
                 'type': type,
                 'data': {
-                    'obj_id': data['id']  # data is block
+                    'obj_id': data.id  # data is block
                 }
             }
         elif type == 'Dropped':
@@ -173,7 +250,7 @@ class MapState:
                 'agent_id': self.agent_id,
                 'type': type,
                 'data': {
-                    'obj_id': data['block']['id'],  # data is block_info
+                    'obj_id': data['block'].id,  # data is block_info
                     'location': data['location']
                 }
             }
@@ -194,34 +271,28 @@ class MapState:
         '''
         parsed_blocks = []
         for block in blocks:
-            parsed_blocks.append({
-                'id': block['obj_id'],
-                'location': block['location'],
-                'shape': block['visualization']['shape'] if 'shape' in block['visualization'].keys() else None,
-                'colour': block['visualization']['colour'] if 'colour' in block['visualization'].keys() else None,
-                'is_collectable': block['is_collectable'],
-                'visited': self._get_block_status(block, False)
-            })
+            visualization = block['visualization']
+            # id, location, shape, colour, is_collectable, visited
+            parsed_blocks.append(Block(block['obj_id'], block['location'], visualization.get('shape'),
+                                       visualization.get('colour'), block['is_collectable'],
+                                       self._get_block_status(block, False)))
         return parsed_blocks
 
-    def _get_drop_zone(self, state):
-        goal_blocks = state.get_with_property({'is_goal_block': True})
+    def _get_drop_zone(self, perceived):
+        '''
+        @param perceived the StateBuckets of the first state
+        '''
+        goal_blocks = list(perceived.ghost_blocks)
 
         # send to other agents about what we know of the drop_zones
         self._queue_message('BlockFound', self._blocks_to_message_format(goal_blocks))
 
         goal_blocks.sort(key=lambda d: d['location'][1], reverse=True)
-        self.goal_blocks = [{
-            'priority': i,
-            'location': d['location'],
-            'found_blocks': {},
-            'plausible_blocks': {'colour': {}, 'shape': {}},
-            'properties': {
-                'shape': d['visualization']['shape'] if 'shape' in d['visualization'] else None,
-                'colour': d['visualization']['colour'] if 'colour' in d['visualization'] else None
-            },
-            'filled': None,  # block which has been dropped on this spot
-        } for i, d in enumerate(goal_blocks)]
+        self.goal_blocks = [DropSpot(i, d['location'],
+                                     shape=d['visualization'].get('shape'),
+                                     colour=d['visualization'].get('colour'))
+                            for i, d in enumerate(goal_blocks)]
+        self._drop_spots = {drop_spot.location: drop_spot for drop_spot in self.goal_blocks}
 
     def _get_rooms(self, state):
         '''
@@ -245,16 +316,30 @@ class MapState:
     def _get_goal_colour_set(self):
         '''
         return a set of wanted colours. if the goal block has been filled, then its colour is ignored.
+        The set is cached until the goals change, so it is frozen.
         '''
-        return set([x['properties']['colour'] for x in self.goal_blocks if
-                    x['properties']['colour'] is not None and x['filled'] is None])
+        if self._goal_colours is None:
+            self._goal_colours = frozenset([x.colour for x in self.goal_blocks if
+                                            x.colour is not None and x.filled is None])
+        return self._goal_colours
 
     def _get_goal_shape_set(self):
         '''
         return a set of wanted shapes, if the goal block has been filled, then its colour is ignored.
+        The set is cached until the goals change, so it is frozen.
         '''
-        return set([x['properties']['shape'] for x in self.goal_blocks if
-                    x['properties']['shape'] is not None and x['filled'] is None])
+        if self._goal_shapes is None:
+            self._goal_shapes = frozenset([x.shape for x in self.goal_blocks if
+                                           x.shape is not None and x.filled is None])
+        return self._goal_shapes
+
+    def _get_half_known_blocks(self, index, wanted):
+        '''
+        @return the blocks in the given bucket index with a key in wanted, in the order of self.blocks
+        '''
+        res = [self.blocks[block_id] for key in wanted for block_id in index.get(key, ())]
+        res.sort(key=lambda block: self._block_order[block.id])
+        return res
 
     def _get_dist(self, loc1: tuple, loc2: tuple):
         '''
@@ -266,12 +351,6 @@ class MapState:
     #                                         public methods                                        #
     #################################################################################################
 
-    def contains_block(self, block, parsed_blocks: dict):
-        for parsed_block in parsed_blocks:
-            if parsed_block['id'] == block['obj_id']:
-                return True
-        return False
-
     def update_map(self, message: dict, state):
         '''
         update the internal state of the agent. The information could from the agent's
@@ -279,37 +358,47 @@ class MapState:
         Depending on the type attribute of message, this function react differently.
         '''
         if state is not None:
-            # update block info according to agent's own discovery
-            blocks = state.get_with_property({'is_collectable': True})
-            if blocks is not None:
-                self.visible_blocks = self._parse_blocks(blocks)
+            # classify the state once, for all queries of this tick
+            self.perceived = StateBuckets(state, self.agent_id)
+            # update block info according to agent's own discovery. Only the blocks that changed are parsed
+            # and updated, the others are only moved to the end of the block order, like an update does.
+            blocks = self.perceived.blocks
+            if len(blocks) > 0:
                 if self.agent_ability is None:
-                    self.agent_ability = self._get_block_status(self.visible_blocks[0], True)
-                parsed_blocks_to_send = self._update_block(self.visible_blocks)
-
-                # match parsed with unparsed blocks, queue unparsed
-                if parsed_blocks_to_send is not None:
-                    to_send = []
-                    for raw_block in blocks:
-                        if self.contains_block(raw_block, parsed_blocks_to_send):
+                    self.agent_ability = self._get_block_status(blocks[0], False)
+                self.visible_blocks = []
+                to_send = []
+                for raw_block in blocks:
+                    block = self._known_block(raw_block)
+                    if block is not None:
+                        self._block_order[block.id] = next(self._order)
+                        drop_spot = self._drop_spots.get(block.location)
+                        if drop_spot is not None:
+                            self._fill_drop_spot(drop_spot, block.id)
+                    else:
+                        # queue the unparsed blocks that were updated
+                        if self._update_block(self._parse_blocks([raw_block])) is not None:
                             to_send.append(raw_block)
+                        block = self.blocks[raw_block['obj_id']]
+                    self.visible_blocks.append(block)
+                if len(to_send) > 0:
                     self._queue_message('BlockFound', self._blocks_to_message_format(to_send))
             else:
                 self.visible_blocks = []
 
             #  update drop zone information if ghost block found
-            ghost_blocks = state.get_with_property({'is_goal_block': True})
-            self._update_ghost_block(ghost_blocks, False)
-            self.agent_location = state.get_self()['location']
+            self._update_ghost_block([ghost_block for ghost_block in self.perceived.ghost_blocks
+                                      if not self._is_known_ghost_block(ghost_block)], False)
+            self.agent_location = self.perceived.own['location']
 
         if message is not None:
             if message['type'] == 'BlockFound':
                 blocks = self._parse_blocks(message['data']['blocks'])
                 self._update_block(blocks)
                 for block in blocks:
-                    if block['is_collectable']:
+                    if block.is_collectable:
                         _, to_be_updated = self._update_collectable_blocks(self.received_blocks, block)
-                        self.received_blocks[block['id']] = to_be_updated
+                        self.received_blocks[block.id] = to_be_updated
                         if self.team_members[message['agent_id']]['ability'] is None:
                             self.team_members[message['agent_id']]['ability'] = self._get_block_status(block, True)
 
@@ -322,9 +411,7 @@ class MapState:
             elif message['type'] == 'Dropped':
                 # print("handling message drop", message)
                 drop_info = {
-                    'block': {
-                        'id': message['data']['obj_id']
-                    },
+                    'block': Block(message['data']['obj_id']),
                     'location': message['data']['location']
                 }
 
@@ -332,7 +419,7 @@ class MapState:
 
                 self.drop_block(drop_info, queue=False)
                 for block in self.team_members[message['agent_id']]['carried_blocks']:
-                    if block['id'] == message['data']['obj_id']:
+                    if block.id == message['data']['obj_id']:
                         self.team_members[message['agent_id']]['carried_blocks'].remove(block)
 
     def get_message_queue(self):
@@ -373,23 +460,15 @@ class MapState:
             of the goal blocks. If the agent is not colour blind, then it may worth to go and confirm 
             the colour of these blocks. RESULT COUBLE BE EMPTY.
         '''
-        res = []
-        for block in self.blocks.values():
-            if block['visited'] == 1 and block['colour'] in self._get_goal_colour_set():
-                res.append(block)
-        return res
+        return self._get_half_known_blocks(self._shape_only, self._get_goal_shape_set())
 
     def get_candidate_blocks_colour(self):
         '''
-        @return list of blocks which does not have shape information but have matching shape with one
+        @return list of blocks which does not have shape information but have matching colour with one
             of the goal blocks. If the agent is not shape blind, then it may worth to go and confirm 
             the shape of these blocks. RESULT COULD BE EMPTY.
         '''
-        res = []
-        for block in self.blocks.values():
-            if block['visited'] == 2 and block['shape'] in self._get_goal_shape_set():
-                res.append(block)
-        return res
+        return self._get_half_known_blocks(self._colour_only, self._get_goal_colour_set())
 
     def get_matching_blocks(self):
         '''
@@ -401,28 +480,25 @@ class MapState:
             could return empty list
         '''
         res = []
-        blocks = self.blocks.values()
-        # check if all goal blocks has been filled or none of them has been discovered
-        for block in blocks:
-            # if (block['visited'] & filtering_criteria) == 0:
-            if block['visited'] != 3:
+        # look up the fully visited blocks with the shape and colour of every goal, instead of checking all blocks
+        for i, g_block in enumerate(self.goal_blocks):
+            # if this goal has already been found a block, no need to check with it
+            if bool(g_block.found_blocks):
+                continue
+            key = (g_block.shape, g_block.colour)
+            if key[0] is None or key[1] is None:
                 continue
-            for i, g_block in enumerate(self.goal_blocks):
-                # if this goal has already been found a block, no need to check with it
-                if bool(g_block['found_blocks']):
-                    continue
-                is_matching = g_block['properties']['colour'] is not None and \
-                              block['colour'] == g_block['properties']['colour'] and \
-                              g_block['properties']['shape'] is not None and \
-                              block['shape'] == g_block['properties']['shape']
-                if is_matching:
-                    res.append([
-                        i,  # priority(order)
-                        g_block['location'],
-                        block,
-                        True if block['id'] in self.carried_blocks.keys() else False
-                        # whether the block has been picked up
-                    ])
+            for block_id in self._match_index.get(key, ()):
+                block = self.blocks[block_id]
+                res.append([
+                    i,  # priority(order)
+                    g_block.location,
+                    block,
+                    True if block.id in self.carried_blocks.keys() else False
+                    # whether the block has been picked up
+                ])
+        # in the order of the blocks in self.blocks, then of the goals
+        res.sort(key=lambda match: self._block_order[match[2].id])
         return res
 
     def get_mismatched_spots(self):
@@ -431,11 +507,11 @@ class MapState:
         '''
         res = []
         for drop_spot in self.goal_blocks:
-            if drop_spot['filled'] is None:
+            if drop_spot.filled is None:
                 return []
-            drop_spot_block = self.blocks.get(drop_spot['filled'])
-            if drop_spot['properties']['shape'] != drop_spot_block['shape'] or \
-                    drop_spot['properties']['colour'] != drop_spot_block['colour']:
+            drop_spot_block = self.blocks.get(drop_spot.filled)
+            if drop_spot.shape != drop_spot_block.shape or \
+                    drop_spot.colour != drop_spot_block.colour:
                 res.append(drop_spot)
         return res
 
@@ -460,7 +536,7 @@ class MapState:
     def get_next_drop_zone(self):
         for dz in self.goal_blocks:
             #  if this goal has already been filled, then check the next one
-            if dz['filled'] != None:
+            if dz.filled != None:
                 continue
             return dz
 
@@ -476,7 +552,7 @@ class MapState:
         if rag <= 0:
             return res
         for block in blocks:
-            if self._get_dist(loc, block[2]['location']) <= rag:
+            if self._get_dist(loc, block[2].location) <= rag:
                 res.append(block)
         return res
 
@@ -490,50 +566,57 @@ class MapState:
         for gb in self.goal_blocks:
             # if this goal block has already been assigned a block, then skip it. This ensures that if there are
             # multiple goals that have the same block, we won't assign the same block to two of them.
-            if gb['filled'] is not None and gb['filled'] == block['id']:
-                gb['filled'] = None
+            if gb.filled is not None and gb.filled == block.id:
+                gb.filled = None
+                self._goals_changed()
                 break
-            if bool(gb['found_blocks']):
+            if bool(gb.found_blocks):
                 continue
-            if gb['properties']['shape'] == block['shape'] and gb['properties']['colour'] == block['colour']:
-                gb['found_blocks'][block['id']] = block
+            if gb.shape == block.shape and gb.colour == block.colour:
+                gb.found_blocks[block.id] = block
                 # once we assign this block to a goal, we cannot assign it to any other ones
                 break
 
         # if it called by ourselves, tell other people and save it into our blocks
         if queue:
             self._queue_message('PickUp', block)
-            self.carried_blocks[block['id']] = block
+            self.carried_blocks[block.id] = block
         # otherwise it's a message from other people, so delete from our blocks
-        self.blocks.pop(block['id'], None)
+        self.blocks.pop(block.id, None)
+        self._unindex_block(block.id)
 
     def drop_block(self, drop_info: dict, queue=True):
-        block_id = self.carried_blocks.pop(drop_info['block']['id'], None)
+        block = self.carried_blocks.pop(drop_info['block'].id, None)
         if queue:
             self._queue_message('Dropped', drop_info)
-        if block_id is not None:
+        if block is not None:
             for drop_spot in self.goal_blocks:
-                if drop_spot['location'] == drop_info['location']:
-                    drop_spot['filled'] = drop_info['block']['id']
+                if drop_spot.location == drop_info['location']:
+                    drop_spot.filled = drop_info['block'].id
+                    self._goals_changed()
                     return
             # if the agent drop the block outside of the dropzone, then add the block back to collection
-            self.blocks[block_id] = drop_info['block']
+            self.blocks[block.id] = drop_info['block']
+            self._index_block(drop_info['block'])
 
     def are_nearby_blocks_visited(self):
         if len(self.visible_blocks) == 0 or len(self.received_blocks) == 0:
             return False
         res = True
         for block in self.visible_blocks:
-            received_block = self.received_blocks.pop(block['id'], None)
+            received_block = self.received_blocks.pop(block.id, None)
             if received_block is None:
                 return False
-            res = res and (received_block['visited'] == 3 or received_block['visited'] == self.agent_ability)
+            res = res and (received_block.visited == 3 or received_block.visited == self.agent_ability)
         return res
 
-    def get_nearby_agent(self, state):
+    def get_nearby_agent(self, perceived):
+        '''
+        @param perceived the StateBuckets of this tick, see update_map
+        '''
         res = []
         self_loc = self.get_agent_location()
-        for team_mate in state.get_with_property({'isAgent': True}):
+        for team_mate in perceived.agents:
             if self._get_dist(self_loc, team_mate['location']) <= 2:
                 res.append(team_mate['obj_id'])
         return list(map(lambda x: self.team_members[x], res))
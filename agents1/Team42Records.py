@@ -0,0 +1,79 @@
+class Block:
+    '''
+    What MapState knows of a block. Made from the block dicts in the state or in messages by
+    MapState._parse_blocks, the only place where blocks are converted.
+
+    id: unique id of the block. Can be used to distinguish different blocks.
+    location: (x, y) location of the block
+    shape: 0|1|2 shape of the block(could be None)
+    colour: (string) colour of the block(could be None)
+    is_collectable: this attribute is mainly used to distinguish ghost_blocks from normal block. When a ghost
+        is discovered, it only updates the drop_zone information and leave the blocks alone.
+    visited: The block will be marked as visited(3) when both the shape info and the colour
+        info have been discovered. Otherwise, this attribute has value 1 for having shape info only,
+        and 2 for having colour info only.
+    '''
+    __slots__ = ('id', 'location', 'shape', 'colour', 'is_collectable', 'visited')
+
+    def __init__(self, id, location=None, shape=None, colour=None, is_collectable=True, visited=0):
+        self.id = id
+        self.location = location
+        self.shape = shape
+        self.colour = colour
+        self.is_collectable = is_collectable
+        self.visited = visited
+
+    def __eq__(self, other):
+        '''
+        Blocks are equal when all their attributes are, as the dicts they replace.
+        '''
+        if not isinstance(other, Block):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in Block.__slots__)
+
+    # blocks are mutable, as the dicts they replace
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Block(' + ', '.join(name + '=' + repr(getattr(self, name)) for name in Block.__slots__) + ')'
+
+
+class DropSpot:
+    '''
+    A spot of the drop zone, made from its ghost block.
+
+    priority: the order in which the spot must be filled
+    location: (x, y) location of the spot
+    shape: shape of the block wanted on the spot(could be None until discovered)
+    colour: colour of the block wanted on the spot(could be None until discovered)
+    found_blocks: id -> Block of the block picked up for this spot
+    filled: id of the block which has been dropped on this spot, None if empty
+    '''
+    __slots__ = ('priority', 'location', 'shape', 'colour', 'found_blocks', 'filled')
+
+    def __init__(self, priority, location, shape=None, colour=None):
+        self.priority = priority
+        self.location = location
+        self.shape = shape
+        self.colour = colour
+        self.found_blocks = {}
+        self.filled = None
+
+    def copy(self):
+        '''
+        @return a shallow copy, sharing found_blocks, like dict.copy
+        '''
+        res = DropSpot(self.priority, self.location, self.shape, self.colour)
+        res.found_blocks = self.found_blocks
+        res.filled = self.filled
+        return res
+
+    def __eq__(self, other):
+        if not isinstance(other, DropSpot):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in DropSpot.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'DropSpot(' + ', '.join(name + '=' + repr(getattr(self, name)) for name in DropSpot.__slots__) + ')'
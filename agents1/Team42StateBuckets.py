@@ -0,0 +1,26 @@
+class StateBuckets:
+    '''
+    Classification of the objects in the state of one tick, made in a single walk over the state.
+    Replaces the get_with_property queries of MapState and the agent states, which each scan the whole state.
+    The buckets keep the order of the state, like get_with_property, but are empty lists instead of None.
+    '''
+
+    def __init__(self, state, agent_id):
+        '''
+        @param state the State of this tick
+        @param agent_id the id of the agent that perceives the state
+        '''
+        self.blocks = []  # the collectable blocks, {'is_collectable': True}
+        self.ghost_blocks = []  # the blocks that show what to drop, {'is_goal_block': True}
+        self.agents = []  # all agents including ourselves, {'isAgent': True}
+        for obj in state.as_dict().values():
+            if obj.get('is_collectable', False) is True:
+                self.blocks.append(obj)
+            elif obj.get('is_goal_block', False) is True:
+                self.ghost_blocks.append(obj)
+            elif obj.get('isAgent', False) is True:
+                self.agents.append(obj)
+        # our own properties, as get_with_property({'carried_by': agent_id}) returns them
+        self.own = state.as_dict().get(agent_id)
+        # id -> properties of the objects we carry
+        self.carried = {} if self.own is None else {obj['obj_id']: obj for obj in self.own['is_carrying']}
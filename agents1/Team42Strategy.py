@@ -36,7 +36,7 @@ class Team42Strategy:
         return NormalStrategy(agent, slowdown)
 
     def is_all_blocks_found(self, map_state: MapState):
-        return reduce(lambda a, b: a + bool(b['found_blocks']), map_state.goal_blocks, 0) == len(map_state.goal_blocks)
+        return reduce(lambda a, b: a + bool(b.found_blocks), map_state.goal_blocks, 0) == len(map_state.goal_blocks)
 
     def get_matching_blocks_nearby(self, map_state: MapState):
         return map_state.filter_blocks_within_range(loc=map_state.get_agent_location(),
@@ -1,5 +1,5 @@
 def match_blocks(block1, block2):
-    return block1['shape'] == block2['shape'] and block1['colour'] == block2['colour']
+    return block1.shape == block2.shape and block1.colour == block2.colour
 
 
 def distance_manhattan(p1, p2):
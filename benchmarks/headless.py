@@ -0,0 +1,66 @@
+'''
+Measures what the headless mode of BW4TWorld gains over the default settings
+(api and visualizer running): the startup time of BW4TWorld and the ticks
+per second of the run.
+Every measurement runs in its own interpreter, because the matrx web servers
+keep the process alive and can only be started once per port.
+
+usage: python -m benchmarks.headless [repetitions]
+'''
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ['default', 'headless']
+
+
+def measure(mode:str) -> dict:
+    '''
+    run one session in the given mode
+    @return dict with startup time (s), run time (s) and nr of ticks
+    '''
+    from agents1.Team42Agent import Team42Agent
+    from bw4t.BW4TWorld import BW4TWorld, DEFAULT_WORLDSETTINGS
+
+    settings = DEFAULT_WORLDSETTINGS.copy()
+    settings['matrx_paused'] = False
+    settings['tick_duration'] = 0
+    settings['headless'] = mode == 'headless'
+    agents = [{'name': f"agent{i}", 'botclass': Team42Agent, 'settings': {'slowdown': 1}}
+              for i in range(3)]
+
+    logdir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    world = BW4TWorld(agents, settings, logdir=logdir)
+    started = time.perf_counter()
+    world.run()
+    done = time.perf_counter()
+    shutil.rmtree(logdir)
+    return {'startup': started - start, 'run': done - started,
+            'ticks': world._gridworld.current_nr_ticks}
+
+
+def measure_in_child(mode:str) -> dict:
+    res = subprocess.run([sys.executable, '-m', 'benchmarks.headless', '--child', mode],
+                         capture_output=True, text=True, check=True)
+    line = [l for l in res.stdout.splitlines() if l.startswith('RESULT ')][-1]
+    return json.loads(line[len('RESULT '):])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        print('RESULT ' + json.dumps(measure(sys.argv[2])), flush=True)
+        # the api and visualizer threads never stop by themselves
+        os._exit(0)
+
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    results = {mode: [measure_in_child(mode) for _ in range(repetitions)] for mode in MODES}
+    print(f"{'mode':10} {'startup (s)':>12} {'ticks/s':>10}")
+    for mode, runs in results.items():
+        startup = sum(r['startup'] for r in runs) / len(runs)
+        tps = sum(r['ticks'] for r in runs) / sum(r['run'] for r in runs)
+        print(f"{mode:10} {startup:12.4f} {tps:10.1f}")
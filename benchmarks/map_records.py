@@ -0,0 +1,142 @@
+'''
+Compares how Team42's MapState keeps its blocks: as the dicts it used
+before ('dicts') and as the current __slots__ Block records ('records').
+For worlds with thousands of blocks it measures the memory of all parsed
+blocks, the time to parse them from the state and the time to update all
+of them with what another agent sees, as _update_collectable_blocks does.
+Also checks both give the same blocks.
+
+usage: python -m benchmarks.map_records [repeats]
+'''
+import operator
+import random
+import sys
+import time
+import tracemalloc
+
+from agents1.Team42MapState import MapState
+from bw4t.BW4TBlocks import CollectableBlock
+
+SIZES = [1000, 5000, 20000]
+COLOURS = ['#0008ff', '#ff1500', '#0dff00', '#fffb00', '#ff00ff']
+
+
+def perceive(size:int, hide:str) -> list:
+    '''
+    @param hide the visualization key that the perceiving agent cannot see
+    @return the properties of size blocks, as they are in the state of the agent
+    '''
+    rnd = random.Random(size)
+    blocks = []
+    for i in range(size):
+        block = CollectableBlock((i % 200, i // 200), f"block{i}", rnd.choice(COLOURS), rnd.randint(0, 2), 0.5)
+        properties = block.properties
+        properties['visualization'].pop(hide)
+        blocks.append(properties)
+    return blocks
+
+
+def parse_dicts(map_state:MapState, blocks:list) -> list:
+    '''
+    the previous MapState._parse_blocks
+    '''
+    return [{
+        'id': block['obj_id'],
+        'location': block['location'],
+        'shape': block['visualization']['shape'] if 'shape' in block['visualization'].keys() else None,
+        'colour': block['visualization']['colour'] if 'colour' in block['visualization'].keys() else None,
+        'is_collectable': block['is_collectable'],
+        'visited': status_dicts(block, False)
+    } for block in blocks]
+
+
+def status_dicts(block:dict, is_parsed:bool) -> int:
+    '''
+    the previous MapState._get_block_status
+    '''
+    has_shape = (is_parsed and (block['shape'] is not None)) or \
+                (not is_parsed and 'shape' in block['visualization'].keys())
+    has_color = (is_parsed and (block['colour'] is not None)) or \
+                (not is_parsed and 'colour' in block['visualization'].keys())
+    return (has_color << 1) | has_shape
+
+
+def update_dicts(map_state:MapState, blocks_container:dict, candidate:dict):
+    '''
+    the previous MapState._update_collectable_blocks
+    '''
+    to_be_updated = blocks_container.pop(candidate['id'], None)
+    updated = False
+    if to_be_updated is None:
+        to_be_updated = candidate
+        updated = True
+    else:
+        if to_be_updated['location'] != candidate['location']:
+            to_be_updated['location'] = candidate['location']
+            updated = True
+        if candidate['shape'] is not None and to_be_updated['shape'] != candidate['shape']:
+            to_be_updated['shape'] = candidate['shape']
+            updated = True
+        if candidate['colour'] is not None and to_be_updated['colour'] != candidate['colour']:
+            to_be_updated['colour'] = candidate['colour']
+            updated = True
+        to_be_updated['visited'] = status_dicts(to_be_updated, True)
+    return updated, to_be_updated
+
+
+def measure(map_state:MapState, representation:tuple, seen:list, told:list, repeats:int) -> dict:
+    '''
+    @param representation (parse, update, block id getter) of the blocks
+    @param seen the blocks in the state of a colourblind agent
+    @param told the same blocks in the state of a shapeblind agent
+    @return the memory of the parsed blocks in a dict by id as MapState.blocks, the mean seconds to
+        parse them and to update them all with told, and the updated blocks
+    '''
+    parse, update, get_id = representation
+    tracemalloc.start()
+    blocks = {get_id(block): block for block in parse(map_state, seen)}
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    parse_time = 0.0
+    update_time = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        blocks = {get_id(block): block for block in parse(map_state, seen)}
+        parse_time += time.perf_counter() - start
+
+        candidates = parse(map_state, told)
+        start = time.perf_counter()
+        for candidate in candidates:
+            _, block = update(map_state, blocks, candidate)
+            blocks[get_id(block)] = block
+        update_time += time.perf_counter() - start
+    return {'memory': memory, 'parse': parse_time / repeats, 'update': update_time / repeats, 'blocks': blocks}
+
+
+def as_dict(block) -> dict:
+    return block if isinstance(block, dict) else {name: getattr(block, name) for name in block.__slots__}
+
+
+REPRESENTATIONS = {
+    'dicts': (parse_dicts, update_dicts, operator.itemgetter('id')),
+    'records': (MapState._parse_blocks, MapState._update_collectable_blocks, operator.attrgetter('id')),
+}
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    # only the block parsing and updating of MapState are used, they need none of its state
+    map_state = MapState.__new__(MapState)
+    print(f"{'blocks':>7}" + ''.join(f"{name:>33}" for name in REPRESENTATIONS))
+    print(f"{'':7}" + f"{'memory kB':>11}{'parse ms':>11}{'update ms':>11}" * len(REPRESENTATIONS))
+    for size in SIZES:
+        seen = perceive(size, 'colour')
+        told = perceive(size, 'shape')
+        results = [measure(map_state, representation, seen, told, repeats)
+                   for representation in REPRESENTATIONS.values()]
+        if any({block_id: as_dict(block) for block_id, block in res['blocks'].items()} !=
+               {block_id: as_dict(block) for block_id, block in results[0]['blocks'].items()} for res in results):
+            raise AssertionError(f"blocks differ for {size} blocks")
+        print(f"{size:7d}" + ''.join(f"{res['memory'] / 1024:11.0f}{1000 * res['parse']:11.2f}"
+                                     f"{1000 * res['update']:11.2f}" for res in results))
@@ -0,0 +1,66 @@
+'''
+Measures how the time to make the states of the agents scales with the
+number of agents and blocks, for the GridWorld perception and the
+static_perception and spatial_perception world settings.
+Every configuration runs a short session of random walking agents in a
+large world, with phase_timing to measure the perception phase.
+
+usage: python -m benchmarks.perception [ticks]
+'''
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import time
+
+from agents1.randomagent import RandomAgent
+from bw4t.BW4TBlocks import CollectableBlock
+from bw4t.BW4TWorld import BW4TWorld, DEFAULT_WORLDSETTINGS
+
+MODES = {
+    'GridWorld': {},
+    'static': {'static_perception': True},
+    'spatial': {'spatial_perception': True},
+}
+# (agents, average blocks per room) in a world of 36 rooms with 96 free tiles each
+SIZES = [(10, 3), (50, 3), (50, 96), (80, 96)]
+
+
+def measure(nr_agents:int, blocks_per_room:int, mode:dict, ticks:int) -> dict:
+    '''
+    run one session
+    @return dict with the nr of blocks in the world, the mean seconds per
+        tick spent in the perception phase and the seconds of the whole run
+    '''
+    settings = DEFAULT_WORLDSETTINGS.copy()
+    settings.update({'headless': True, 'tick_duration': 0, 'matrx_paused': False,
+                     'deadline': ticks, 'phase_timing': True,
+                     'nr_rooms': 36, 'rooms_per_row': 6, 'room_size': (14, 10),
+                     'average_blocks_per_room': blocks_per_room})
+    settings.update(mode)
+    agents = [{'name': f"agent{i}", 'botclass': RandomAgent, 'settings': {'slowdown': 1}}
+              for i in range(nr_agents)]
+    logdir = tempfile.mkdtemp()
+    try:
+        # the random agents and the phase timer print a lot
+        with contextlib.redirect_stdout(io.StringIO()):
+            world = BW4TWorld(agents, settings, logdir=logdir)
+            start = time.perf_counter()
+            world.run()
+            run = time.perf_counter() - start
+    finally:
+        shutil.rmtree(logdir)
+    return {'blocks': len(world._gridworld.get_objects_in_range((0, 0), CollectableBlock, float('inf'))),
+            'perception': world.getPhaseTimer().getSummary()['perception']['mean'] / 1e6,
+            'run': run}
+
+
+if __name__ == "__main__":
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"{'agents':>7}{'blocks':>9}" + ''.join(f"{mode:>22}" for mode in MODES))
+    print(f"{'':16}" + f"{'perception ms':>14}{'run s':>8}" * len(MODES))
+    for nr_agents, blocks_per_room in SIZES:
+        results = [measure(nr_agents, blocks_per_room, mode, ticks) for mode in MODES.values()]
+        print(f"{nr_agents:7d}{results[0]['blocks']:9d}" +
+              ''.join(f"{1000 * res['perception']:14.2f}{res['run']:8.2f}" for res in results))
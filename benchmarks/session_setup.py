@@ -0,0 +1,53 @@
+'''
+Measures the per-session setup cost of creating a new BW4TWorld for every
+session against reusing the WorldBuilder through BW4TWorldFactory.
+Only the construction of the world is timed, the sessions are not run.
+Also checks that both give the same blocks for the same seed.
+
+usage: python -m benchmarks.session_setup [sessions]
+'''
+import shutil
+import sys
+import tempfile
+import time
+
+from agents1.Team42Agent import Team42Agent
+from bw4t.BW4TWorld import BW4TWorld, BW4TWorldFactory, DEFAULT_WORLDSETTINGS
+
+
+def blocks(world:BW4TWorld) -> list:
+    '''
+    @return sorted (location, shape, colour) of all blocks in the world
+    '''
+    objs = world._gridworld.environment_objects.values()
+    return sorted((obj.location, obj.visualize_shape, obj.visualize_colour)
+                  for obj in objs if obj.properties.get('is_collectable'))
+
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    agents = [{'name': f"agent{i}", 'botclass': Team42Agent, 'settings': {'slowdown': 1}}
+              for i in range(3)]
+    settings = DEFAULT_WORLDSETTINGS.copy()
+    settings['headless'] = True
+    logdir = tempfile.mkdtemp()
+    factory = BW4TWorldFactory()
+
+    times = {'new BW4TWorld': 0.0, 'BW4TWorldFactory': 0.0}
+    for seed in range(1, sessions + 1):
+        settings['random_seed'] = seed
+
+        start = time.perf_counter()
+        fresh = BW4TWorld(agents, settings.copy(), logdir=logdir)
+        times['new BW4TWorld'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        reused = factory.create(agents, settings.copy(), logdir=logdir)
+        times['BW4TWorldFactory'] += time.perf_counter() - start
+
+        if blocks(fresh) != blocks(reused):
+            raise AssertionError(f"worlds differ for seed {seed}")
+
+    shutil.rmtree(logdir)
+    for name, total in times.items():
+        print(f"{name:18} {1000 * total / sessions:8.2f} ms per session")
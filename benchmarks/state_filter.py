@@ -0,0 +1,76 @@
+'''
+Measures the per-tick cost of the colourblind + shapeblind filtering in
+BW4TBrain.filter_observations against the number of perceived objects.
+'copying' is the previous filter, that rebuilt the state with copied
+property and visualization dicts once for every blindness. 'in place' is
+the current single pass over the state. Also checks both give the same state.
+
+usage: python -m benchmarks.state_filter [ticks]
+'''
+import sys
+import time
+
+from matrx.agents.agent_utils.state import State # type: ignore
+from matrx.objects.env_object import EnvObject # type: ignore
+
+from bw4t.BW4TBrain import BW4TBrain
+
+SIZES = [100, 500, 1000, 2000, 5000]
+
+
+class IdleBrain(BW4TBrain):
+    def decide_on_bw4t_action(self, state:State):
+        return None, {}
+
+
+def copying(state:State, hidden:list) -> State:
+    '''
+    the previous filter: one state_update with copied dicts per hidden key
+    '''
+    for key in hidden:
+        def strip(values:dict) -> dict:
+            if not 'visualization' in values:
+                return values
+            newvis = values['visualization'].copy()
+            newvis.pop(key)
+            newvalues = values.copy()
+            newvalues['visualization'] = newvis
+            return newvalues
+        state = state.state_update({id: strip(vals) for id, vals in state.items()})
+    return state
+
+
+def perceive(objects:list) -> dict:
+    '''
+    @return a state dict as the GridWorld makes it for an agent every tick
+    '''
+    state = {obj.obj_id: obj.properties for obj in objects}
+    state['World'] = {'nr_ticks': 0, 'team_members': ['agent']}
+    return state
+
+
+if __name__ == "__main__":
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    brain = IdleBrain({'colorblind': True, 'shapeblind': True})
+    brain.initialize()
+    print(f"{'objects':>8}{'copying':>14}{'in place':>14}")
+    for size in SIZES:
+        objects = [EnvObject(location=(i % 100, i // 100), name=f"obj{i}", class_callable=EnvObject)
+                   for i in range(size)]
+        times = {'copying': 0.0, 'in place': 0.0}
+        for tick in range(ticks):
+            old = State('agent')
+            old.state_update(perceive(objects))
+            start = time.perf_counter()
+            old = copying(old, ['colour', 'shape'])
+            times['copying'] += time.perf_counter() - start
+
+            new = State('agent')
+            new.state_update(perceive(objects))
+            start = time.perf_counter()
+            new = brain.filter_observations(new)
+            times['in place'] += time.perf_counter() - start
+
+            if old.as_dict() != new.as_dict():
+                raise AssertionError(f"filters differ for {size} objects")
+        print(f"{size:8d}" + ''.join(f"{1000 * t / ticks:11.3f} ms" for t in times.values()))
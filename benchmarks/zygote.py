@@ -0,0 +1,37 @@
+'''
+Measures the startup latency of a session, from launching it until its
+world is ready to run: in a new python interpreter (run_fresh) against
+forked from a warmed up process (run_forked). The sessions are short,
+only the startup is of interest.
+
+usage: python -m benchmarks.zygote [sessions]
+'''
+import shutil
+import statistics
+import sys
+import tempfile
+
+from agents1.Team42Agent import Team42Agent
+from bw4t.BW4TWorld import DEFAULT_WORLDSETTINGS
+from bw4t.tournament import sessionSpecs
+from bw4t.zygote import run_forked, run_fresh
+
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    agents = [{'name': f"agent{i}", 'botclass': Team42Agent, 'settings': {}} for i in range(2)]
+    agent_settings = [{'colourblind': False, 'shapeblind': False, 'slowdown': 1}]
+    settings = DEFAULT_WORLDSETTINGS.copy()
+    settings.update({'headless': True, 'deadline': 10, 'tick_duration': 0})
+    logdir = tempfile.mkdtemp()
+    spec = sessionSpecs(agents, agent_settings, 2, settings, logdir=logdir)[0]
+    specs = [dict(spec, index=i) for i in range(sessions)]
+
+    startups = {
+        'fresh interpreter': [run_fresh(s)['startup'] for s in specs],
+        'forked': [summary['startup'] for summary in run_forked(specs)],
+    }
+    shutil.rmtree(logdir)
+    for name, times in startups.items():
+        print(f"{name:18} mean {1000 * statistics.mean(times):8.1f} ms"
+              f"  median {1000 * statistics.median(times):8.1f} ms")
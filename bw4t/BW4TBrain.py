@@ -2,8 +2,12 @@ from abc import  ABC, abstractmethod
 from matrx.agents.agent_utils.state import State # type: ignore
 from matrx.agents import AgentBrain # type: ignore
 from matrx.actions.object_actions import DropObject # type: ignore
-from typing import final, List, Dict, Final, Set
+from typing import final, List, Dict, Final, Optional, Set, Tuple
 from matrx.messages import Message # type: ignore
+import cProfile
+import math
+import os
+import time
 import traceback 
 
 class BW4TBrain(AgentBrain, ABC):
@@ -14,7 +18,8 @@ class BW4TBrain(AgentBrain, ABC):
         
     NOT_ALLOWED_PARAMS:Final[Set[str]] ={'remove_range', 'grab_range', 'door_range', 'action_duration'}
     
-    DEFAULT_SETTINGS:Final[Dict[str,object]]={'slowdown':1, 'colorblind':False,'shapeblind':False}
+    DEFAULT_SETTINGS:Final[Dict[str,object]]={'slowdown':1, 'colorblind':False,'shapeblind':False,
+        'profile':False, 'budget_ms':None, 'strict_budget':False}
 
     def __init__(self, settings:Dict[str,object]):
         '''
@@ -27,11 +32,22 @@ class BW4TBrain(AgentBrain, ABC):
         FIXME this is hacky. These parameters should really be private.
         * colorblind: bool. If true, all color info is removed from state
         * shapeblind: bool. if true, all shape info is removed from state 
+        * profile: bool. If true, filter_bw4t_observations and decide_on_bw4t_action
+        are profiled with cProfile over the whole session, see writeProfile.
+        This slows the agent down, also in the logged latencies.
+        * budget_ms: float or None. The time decide_on_bw4t_action may take
+        per call. Calls that take longer are counted as overruns and logged.
+        * strict_budget: bool. If true, the action of a call that overran the
+        budget is replaced by (None, {}). The call itself is not interrupted.
         
         Missing values get the value from DEFAULT_SETTINGS.
         '''
         self.__settings = self.DEFAULT_SETTINGS.copy()
         self.__settings.update(settings)
+        self.__profiler:Optional[cProfile.Profile] = cProfile.Profile() if self.__settings['profile'] else None
+        # the visualization keys this agent can not see
+        self.__hidden:Tuple[str,...]=tuple(key for key,setting in [('colour','colorblind'),('shape','shapeblind')]
+            if self.__settings[setting])
         super().__init__()
     
     @final
@@ -39,15 +55,33 @@ class BW4TBrain(AgentBrain, ABC):
         super().initialize()
         self.__previous_tick_sent_messages:List[Message]=[]
         self.__drop_off_locations:List[tuple]=[]
+        # wall time in ns of the agent's hooks since the last get_log_data
+        self.__filter_ns=0
+        self.__decide_ns=0
+        # number of decide calls over budget since the last get_log_data
+        self.__overruns=0
         
     @final
     def decide_on_action(self, state:State):
+        start=time.perf_counter_ns()
+        if self.__profiler is not None:
+            self.__profiler.enable()
         try:
             act,params = self.decide_on_bw4t_action(state)
         except:
             print("IGNORING ERROR FROM AGENT ")
             traceback.print_exc() 
             act,params=None,{}
+        finally:
+            if self.__profiler is not None:
+                self.__profiler.disable()
+        duration=time.perf_counter_ns()-start
+        self.__decide_ns+=duration
+        budget=self.__settings['budget_ms']
+        if budget is not None and duration > budget*1e6:
+            self.__overruns+=1
+            if self.__settings['strict_budget']:
+                act,params=None,{}
             
         wrong = self.NOT_ALLOWED_PARAMS.intersection(set(params.keys()))
         if len(wrong) > 0:
@@ -65,20 +99,22 @@ class BW4TBrain(AgentBrain, ABC):
     
     @final 
     def filter_observations(self,state:State)->State:
-        newstate=state
-        if self.__settings['colorblind']:
-            newstate=state.state_update({id:self.__filterColor(vals) 
-                for id,vals in state.items() })
-        if self.__settings['shapeblind']:
-            newstate=state.state_update({id:self.__filterShape(vals) 
-                for id,vals in state.items() })
+        if self.__hidden:
+            self.__filterVisualization(state.as_dict())
 
+        start=time.perf_counter_ns()
+        if self.__profiler is not None:
+            self.__profiler.enable()
         try:
-            res= self.filter_bw4t_observations(newstate)
+            res= self.filter_bw4t_observations(state)
         except:
             print("IGNORING ERROR FROM AGENT ")
             traceback.print_exc()
-            res=newstate
+            res=state
+        finally:
+            if self.__profiler is not None:
+                self.__profiler.disable()
+        self.__filter_ns+=time.perf_counter_ns()-start
 
         self.__previous_tick_sent_messages=self.messages_to_send.copy()
         return res
@@ -174,32 +210,35 @@ class BW4TBrain(AgentBrain, ABC):
         '''
         pass
     
-    def __filterColor(self, values:dict):
+    def __filterVisualization(self, state_dict:dict):
         '''
-        removes colour from visualization attr. 
-        Colors only appear in the visualization field.
+        removes the hidden keys (colour, shape) from the visualization attr
+        of all objects, in one pass and in place. Colors and shapes only
+        appear in the visualization field. The property dicts are made
+        fresh for every agent every tick by the GridWorld, so they are ours to change.
         '''
-        if not 'visualization' in values:
-            return values
-        newvis:dict = values['visualization'].copy()
-        newvis.pop('colour')
-        newvalues=values.copy()
-        newvalues['visualization']=newvis
-        return newvalues
-
-    def __filterShape(self, values:dict)->dict:
+        hidden=self.__hidden
+        for values in state_dict.values():
+            vis=values.get('visualization')
+            if vis is not None:
+                for key in hidden:
+                    vis.pop(key, None)
+    
+    @final
+    def writeProfile(self, logfile:str)->Optional[str]:
         '''
-        removes shape from visualization attr. 
-        shapes only appear in the visualization field.
+        Write the profile of this agent's hooks, if the profile setting is on.
+        The file can be read with pstats or tools like snakeviz.
+        @param logfile the log file of the session, the profile is written next to it
+        @return the file name, <log file without extension>.<agent name>.prof,
+            or None if the agent is not profiled
         '''
-        if not 'visualization' in values:
-            return values
-        newvis:dict = values['visualization'].copy()
-        newvis.pop('shape')
-        newvalues=values.copy()
-        newvalues['visualization']=newvis
-        return newvalues
-    
+        if self.__profiler is None:
+            return None
+        filename=os.path.splitext(logfile)[0]+'.'+self.agent_name+'.prof'
+        self.__profiler.dump_stats(filename)
+        return filename
+
     @final
     def get_log_data(self):
         '''
@@ -225,4 +264,15 @@ class BW4TBrain(AgentBrain, ABC):
         # Add the number of sent messages
         data["prev_tick_messages"] = len(self.__previous_tick_sent_messages)
 
+        # Add the time spent in filter_bw4t_observations and decide_on_bw4t_action
+        # since the previous call, in microseconds rounded up. 0 if not called.
+        data["filter_us"] = math.ceil(self.__filter_ns/1000)
+        data["decide_us"] = math.ceil(self.__decide_ns/1000)
+        self.__filter_ns=0
+        self.__decide_ns=0
+
+        # Add the number of decisions that took longer than the budget
+        data["overruns"] = self.__overruns
+        self.__overruns=0
+
         return data
\ No newline at end of file
@@ -1,18 +1,27 @@
 import numpy as np # type: ignore
-from typing import Final,List
+from typing import Dict,Final,List,Optional,Set
+import json
 import random
 import os
+import shutil
+import tempfile
+import time
 
 from matrx.actions.move_actions import MoveEast, MoveSouth, MoveWest # type: ignore
 from matrx.actions import MoveNorth, OpenDoorAction, CloseDoorAction  # type: ignore
-from matrx.grid_world import GridWorld, DropObject, GrabObject, AgentBody # type: ignore
+from matrx.grid_world import GridWorld, DropObject, GrabObject, RemoveObject, AgentBody # type: ignore
 from matrx import WorldBuilder # type: ignore
 from matrx.world_builder import RandomProperty # type: ignore
 from matrx.agents import SenseCapability # type: ignore
 
 from bw4t.BW4TBlocks import CollectableBlock, GhostBlock
+from bw4t.BW4TBrain import BW4TBrain
 from bw4t.CollectionGoal import CollectionGoal
-from bw4t.bw4tlogger import BW4TLogger
+from bw4t.bw4tlogger import BW4TLogger, BW4TBinaryLogger
+from bw4t.perception import SpatialPerception, StaticPerception
+from bw4t.phasetimer import PhaseTimer
+from bw4t.statistics import agentInfoFilename
+from bw4t.tracer import Tracer
 # Human is special classs that requires special matrx creator..
 from agents1.human import Human
 
@@ -61,6 +70,161 @@ DEFAULT_WORLDSETTINGS: dict={
     
 }
 
+# Settings that may be added to the worldsettings, with the value used when they are left out.
+# BW4TWorld reads them with worldsettings.get, so DEFAULT_WORLDSETTINGS stays as it is.
+OPTIONAL_WORLDSETTINGS: Final[dict]={
+    'stall_ticks': None, # If set, terminate when nothing happened for this many ticks
+    'headless':False, # True skips api, visualizer and their per-tick bookkeeping. Overrides run_matrx_api and run_matrx_visualizer.
+    'log_format':'csv', # 'csv', or 'binary' for the compact format of bw4t.binarylog
+    'phase_timing':False, # True to measure and print how the time of every tick is spent
+    'trace':False, # True to write a trace-event json file (chrome://tracing, Perfetto) next to the log
+    'static_perception':False, # True to build the states of walls, doors and tiles once per agent, see bw4t.perception
+    'spatial_perception':False, # True to also find blocks and agents in range with a spatial hash. Implies static_perception
+    'agent_info':False, # True to write the class and settings of the agents next to the log, for the batch mode of bw4t.statistics
+}
+
+
+# The private matrx methods that BW4TGridWorld and BW4TWorldBuilder override, and bw4t.phasetimer and
+# bw4t.tracer wrap. They are written against matrx 2.0.6, see requirements.txt. If another matrx
+# version renames one of them, the override would silently never be called.
+MATRX_PRIVATE_METHODS:Final[Dict[type,List[str]]]={
+    GridWorld: ['_GridWorld__validate_obj_placement', '_GridWorld__perform_action', '_GridWorld__get_agent_state',
+                '_GridWorld__step', '_GridWorld__sleep', '_GridWorld__check_simulation_goal'],
+    WorldBuilder: ['_WorldBuilder__create_grid_world'],
+}
+# the private attributes of a GridWorld instance that are used
+MATRX_PRIVATE_ATTRIBUTES:Final[List[str]]=['_GridWorld__is_initialized', '_GridWorld__loggers',
+    '_GridWorld__visualization_bg_clr', '_GridWorld__visualization_bg_img']
+
+
+def checkMatrxPrivates(obj, names:List[str]):
+    '''
+    @param obj a matrx class or object
+    @param names the private attributes that obj must have
+    @raise RuntimeError if obj lacks one of them, i.e. the matrx version is not the one this was written for
+    '''
+    missing=[name for name in names if not hasattr(obj, name)]
+    if missing:
+        raise RuntimeError(f"{obj} has no {missing}, bw4t needs matrx 2.0.6 (see requirements.txt)")
+
+
+for matrx_class, names in MATRX_PRIVATE_METHODS.items():
+    checkMatrxPrivates(matrx_class, names)
+
+
+class BW4TGridWorld(GridWorld):
+    '''
+    GridWorld with a faster check of object placement. matrx checks every
+    new object against all objects already in the world, which makes
+    creating a world quadratic in the number of objects.
+    Also tells the simulation goal which objects were grabbed, dropped or
+    removed, so that it does not have to search the world every tick.
+    The states of the agents can be made by a perception, see bw4t.perception.
+    '''
+    # the actions that take objects from or put objects into the world
+    OBJECT_ACTIONS:Final[Set[str]]={GrabObject.__name__, DropObject.__name__, RemoveObject.__name__}
+    # the simulation goal can rely on objectsChanged being called
+    reports_object_changes:Final[bool]=True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        checkMatrxPrivates(self, MATRX_PRIVATE_ATTRIBUTES)
+        # location -> id of the intraversable object there, only used while creating the world
+        self._intraversable_locs:Dict[tuple,str]={}
+        # makes the states of the agents, None to let GridWorld make them
+        self.perception:Optional[StaticPerception]=None
+
+    #override
+    def _GridWorld__validate_obj_placement(self, env_object):
+        # placing a traversable object never fails, no need to look around
+        if env_object.is_traversable:
+            return
+        if self._GridWorld__is_initialized:
+            # objects may have moved since the world was created, do the full check
+            return GridWorld._GridWorld__validate_obj_placement(self, env_object)
+        loc=tuple(env_object.location)
+        if loc in self._intraversable_locs:
+            raise Exception(f"Invalid placement. Could not place object {env_object.obj_id} in grid, location already "
+                f"occupied by intraversable object {[self._intraversable_locs[loc]]} at location {loc}")
+        self._intraversable_locs[loc]=env_object.obj_id
+
+    #override
+    def _GridWorld__perform_action(self, agent_id, action_name, action_kwargs):
+        goal=self.simulation_goal
+        tell_goal=action_name in self.OBJECT_ACTIONS and hasattr(goal, 'objectsChanged')
+        if not tell_goal and self.perception is None:
+            return GridWorld._GridWorld__perform_action(self, agent_id, action_name, action_kwargs)
+        agent=self.registered_agents[agent_id]
+        agent_before=tuple(agent.location)
+        before=self._objectLocations(agent_id, action_kwargs)
+        result=GridWorld._GridWorld__perform_action(self, agent_id, action_name, action_kwargs)
+        after=self._objectLocations(agent_id, action_kwargs)
+        changes={obj_id:(before.get(obj_id), after.get(obj_id)) for obj_id in before.keys()|after.keys()
+                 if before.get(obj_id)!=after.get(obj_id)}
+        if changes and tell_goal:
+            goal.objectsChanged(changes, self)
+        if self.perception is not None:
+            # the perception also needs the moves of the agent itself
+            agent_after=tuple(agent.location) if agent_id in self.registered_agents else None
+            if agent_after!=agent_before:
+                changes[agent_id]=(agent_before, agent_after)
+            if changes:
+                self.perception.objectsChanged(changes)
+        return result
+
+    def _objectLocations(self, agent_id:str, action_kwargs:dict)->Dict[str,tuple]:
+        '''
+        @return location of the objects an object action of the agent can
+            affect: the object in the action arguments and the carried objects.
+            Objects that are not in the world (e.g. carried) are left out.
+        '''
+        obj_ids=[obj.obj_id for obj in self.registered_agents[agent_id].is_carrying]
+        if action_kwargs.get('object_id') is not None:
+            obj_ids.append(action_kwargs['object_id'])
+        objs=self.environment_objects
+        return {obj_id:tuple(objs[obj_id].location) for obj_id in obj_ids if obj_id in objs}
+
+    #override
+    def _GridWorld__get_agent_state(self, agent_obj:AgentBody):
+        perception=self.perception
+        capabilities=agent_obj.sense_capability.get_capabilities()
+        if perception is None or not perception.handles(capabilities):
+            return GridWorld._GridWorld__get_agent_state(self, agent_obj)
+        state=perception.getState(agent_obj, capabilities)
+        state["World"]=self._worldInfo(agent_obj)
+        return state
+
+    def _worldInfo(self, agent_obj:AgentBody)->dict:
+        '''
+        @return the generic 'World' entry of the state of the agent, as GridWorld makes it
+        '''
+        team_members=[agent_id for agent_id,other_agent in self.registered_agents.items()
+                      if agent_obj.team==other_agent.team]
+        return {
+            "nr_ticks": self.current_nr_ticks,
+            "curr_tick_timestamp": int(round(time.time() * 1000)),
+            "grid_shape": self.shape,
+            "tick_duration": self.tick_duration,
+            "team_members": team_members,
+            "world_ID": self.world_id,
+            "vis_settings": {
+                "vis_bg_clr": self._GridWorld__visualization_bg_clr,
+                "vis_bg_img": self._GridWorld__visualization_bg_img
+            }
+        }
+
+
+class BW4TWorldBuilder(WorldBuilder):
+    '''
+    WorldBuilder that creates BW4TGridWorlds
+    '''
+    #override
+    def _WorldBuilder__create_grid_world(self):
+        args = self.world_settings
+        # create a world ID in the shape of "world_" + world number, like WorldBuilder does
+        args['world_id'] = f"world_{self.worlds_created}"
+        return BW4TGridWorld(**args)
+
 
 class BW4TWorld:
     '''
@@ -72,7 +236,8 @@ class BW4TWorld:
     internally creates the gridworld using WorldBuilder.
     
     '''
-    def __init__(self, agents:List[dict], worldsettings:dict=DEFAULT_WORLDSETTINGS):
+    def __init__(self, agents:List[dict], worldsettings:dict=DEFAULT_WORLDSETTINGS, logdir:str='.',
+            builder:WorldBuilder=None):
         '''
            @param agents a list like 
             [
@@ -81,53 +246,141 @@ class BW4TWorld:
             ]
             Names must all be unique.
             Check BW4TBrain for more on the agents specification.
+           @param worldsettings the DEFAULT_WORLDSETTINGS, or a changed copy. May also
+            have any of the OPTIONAL_WORLDSETTINGS.
+           @param logdir the directory where the BW4TLogger writes its log file.
+            Sessions that run at the same time should each get their own logdir,
+            as the log file name only has a resolution of seconds.
+           @param builder the WorldBuilder of an earlier BW4TWorld with the same
+            worldsettings (apart from the BW4TWorldFactory.PER_WORLD_SETTINGS),
+            or None to create a new one. The rooms, blocks and drop zones of the
+            builder are reused, its agents, goal, logger and seed are replaced. See BW4TWorldFactory.
         '''
         self._worldsettings=worldsettings;
         self._agents=agents
+        self._phase_timer:Optional[PhaseTimer]=None
+        self._headless=worldsettings.get('headless', False)
         
         np.random.seed(worldsettings['random_seed'])
+        if builder is None:
+            builder = self._createBuilder()
+        self._builder = builder
+
+        # Everything below is specific for this world.
+        # Reseed the builder so the blocks come out as with a new builder.
+        self._builder.rng = np.random.RandomState(worldsettings['random_seed'])
+        self._builder.world_settings['rnd_seed'] = worldsettings['random_seed']
+        # The goal keeps track of the drop off progress, so can not be shared.
+        self._builder.world_settings['simulation_goal'] = CollectionGoal(worldsettings['deadline'],
+                                                                          worldsettings.get('stall_ticks'))
+        self._builder.worlds_created = 0
+        self._builder.agent_settings = []
+        self._builder.loggers = []
+
+        # Add the agents and human agents to the top row of the world
+        self._addAgents()
+        if worldsettings.get('log_format', 'csv')=='binary':
+            self._builder.add_logger(BW4TBinaryLogger, save_path=logdir)
+        else:
+            self._builder.add_logger(BW4TLogger, save_path=logdir)
+
+        self._gridworld = self._builder.worlds(nr_of_worlds=1).__next__()
+        if worldsettings.get('spatial_perception', False):
+            self._gridworld.perception = SpatialPerception(self._gridworld)
+        elif worldsettings.get('static_perception', False):
+            self._gridworld.perception = StaticPerception(self._gridworld)
+        if worldsettings.get('agent_info', False):
+            self._writeAgentInfo()
+
+    def _writeAgentInfo(self):
+        '''
+        Write the class and settings of every agent next to the log file,
+        the log only has the agent ids. Used by the batch mode of Statistics.
+        '''
+        info={agent['name']:{'botclass':agent['botclass'].__name__, 'settings':agent['settings']}
+              for agent in self._agents}
+        with open(agentInfoFilename(self.getLogger().getFileName()), 'w') as f:
+            json.dump(info, f, default=str)
+
+    def _createBuilder(self)->WorldBuilder:
+        '''
+        @return new WorldBuilder with the rooms, blocks and drop zones,
+        and the api and visualizer started unless we are headless.
+        '''
+        worldsettings=self._worldsettings
         world_size = self.world_size()
     
-        # Create the goal
-        goal = CollectionGoal(worldsettings['deadline'])
-    
         # Create our world builder
-        self._builder = WorldBuilder(shape=world_size, tick_duration=worldsettings['tick_duration'], 
+        self._builder = BW4TWorldBuilder(shape=world_size, tick_duration=worldsettings['tick_duration'], 
            random_seed=worldsettings['random_seed'], 
-           run_matrx_api=worldsettings['run_matrx_api'],
-           run_matrx_visualizer=worldsettings['run_matrx_visualizer'], 
-           verbose=worldsettings['verbose'], simulation_goal=goal)
+           run_matrx_api=worldsettings['run_matrx_api'] and not self._headless,
+           run_matrx_visualizer=worldsettings['run_matrx_visualizer'] and not self._headless, 
+           verbose=worldsettings['verbose'])
     
-        # Hacky? But this is apparently the way to do this.
-        # Also note the extra underscore, maybe that's a buig in matrx?
-        self._builder.api_info['_matrx_paused']=worldsettings['matrx_paused']
+        if not self._headless:
+            # Hacky? But this is apparently the way to do this.
+            # Also note the extra underscore, maybe that's a buig in matrx?
+            self._builder.api_info['_matrx_paused']=worldsettings['matrx_paused']
     
         # Add the world bounds (not needed, as agents cannot 'walk off' the grid, but for visual effects)
         self._builder.add_room(top_left_location=(0, 0), width=world_size[0], height=world_size[1], name="world_bounds")
         room_locations = self._addRooms()
         self._addBlocks( room_locations)
         self._addDropOffZones( world_size)
-    
-        # Add the agents and human agents to the top row of the world
-        self._addAgents()
         
-        media_folder = os.path.dirname(os.path.join(os.path.realpath(__file__), "media"))
-        self._builder.startup(media_folder=media_folder)
-        self._builder.add_logger(BW4TLogger, save_path='.')
-
-        self._gridworld = self._builder.worlds(nr_of_worlds=1).__next__()
+        if not self._headless:
+            # headless runs start no web server, and without api matrx never pauses
+            media_folder = os.path.dirname(os.path.join(os.path.realpath(__file__), "media"))
+            self._builder.startup(media_folder=media_folder)
+        return self._builder
 
     def run(self):
         '''
-        run the world till termination
+        run the world till termination.
+        With the phase_timing setting, prints a summary of the time per
+        tick spent in each phase at the end, see getPhaseTimer.
+        With the trace setting, writes the trace to getTraceFileName.
         @return this 
         '''
+        if self._worldsettings.get('phase_timing', False):
+            self._phase_timer=PhaseTimer()
+            self._phase_timer.instrument(self._gridworld)
+        tracer=None
+        if self._worldsettings.get('trace', False):
+            tracer=Tracer()
+            tracer.instrument(self._gridworld)
         self._gridworld.run(self._builder.api_info)
+        if self._phase_timer is not None:
+            print(self._phase_timer.histogram())
+        if tracer is not None:
+            tracer.write(self.getTraceFileName())
+        # agents with the profile setting write their profile next to the log
+        for brain in self._brains:
+            if isinstance(brain, BW4TBrain):
+                brain.writeProfile(self.getLogger().getFileName())
         return self
+
+    def getTraceFileName(self)->str:
+        '''
+        @return the file the trace is written to with the trace setting, next to the log file
+        '''
+        return os.path.splitext(self.getLogger().getFileName())[0]+'.trace.json'
+
+    def getPhaseTimer(self)->Optional[PhaseTimer]:
+        '''
+        @return the PhaseTimer of the last run, or None if the phase_timing setting is off
+        '''
+        return self._phase_timer
         
+    def getBuilder(self)->WorldBuilder:
+        '''
+        @return the WorldBuilder that created this world
+        '''
+        return self._builder
+
     def getLogger(self)->BW4TLogger:
         '''
-        @return the logger. We assume there is only 1: BW4TLogger
+        @return the logger. We assume there is only 1: BW4TLogger or BW4TBinaryLogger
         '''
         return self._gridworld._GridWorld__loggers[0]
         
@@ -188,8 +441,12 @@ class BW4TWorld:
     
         loc = (0,1) # agents start in horizontal row at top left corner.
         team_name = "Team 1" # currently this supports 1 team 
+        self._brains=[]
         for agent in self._agents:
+            if agent['botclass']==Human and self._headless:
+                raise ValueError(f"Human agent {agent['name']} needs the matrx api, it can not run headless")
             brain = agent['botclass'](agent['settings'])
+            self._brains.append(brain)
             loc = (loc[0] + 1, loc[1])
             if agent['botclass']==Human:
                 self._builder.add_human_agent(loc, brain, 
@@ -281,3 +538,44 @@ class BW4TWorld:
                 
             # Change the x to the next zone
             x = x + self._worldsettings['hallway_space'] + 1
+
+
+
+class BW4TWorldFactory:
+    '''
+    Creates BW4TWorlds, but builds the WorldBuilder with all rooms, blocks
+    and drop zones only once for every distinct worldsettings. Settings
+    that only matter per world (PER_WORLD_SETTINGS) may differ.
+    '''
+    PER_WORLD_SETTINGS:Final[Set[str]]={'random_seed', 'deadline', 'stall_ticks', 'log_format',
+        'phase_timing', 'trace', 'static_perception', 'spatial_perception', 'agent_info'}
+
+    def __init__(self):
+        self._builders:Dict[str, WorldBuilder]={}
+
+    def create(self, agents:List[dict], worldsettings:dict=DEFAULT_WORLDSETTINGS, logdir:str='.')->BW4TWorld:
+        '''
+        @param agents, worldsettings, logdir see BW4TWorld
+        @return new BW4TWorld, ready to run
+        '''
+        key=self._key(worldsettings)
+        world=BW4TWorld(agents, worldsettings, logdir, builder=self._builders.get(key))
+        self._builders[key]=world.getBuilder()
+        return world
+
+    def prepare(self, worldsettings:dict):
+        '''
+        Build the WorldBuilder for the given worldsettings now, if not done
+        yet, by creating a world without agents that is thrown away.
+        '''
+        if self._key(worldsettings) in self._builders:
+            return
+        logdir=tempfile.mkdtemp()
+        self.create([], dict(worldsettings, agent_info=False), logdir)
+        shutil.rmtree(logdir)
+
+    def _key(self, worldsettings:dict)->str:
+        # a left out optional setting is the same as its default
+        worldsettings=dict(OPTIONAL_WORLDSETTINGS, **worldsettings)
+        return json.dumps({k:v for k,v in worldsettings.items() if k not in self.PER_WORLD_SETTINGS},
+            sort_keys=True, default=str)
@@ -1,3 +1,4 @@
+from typing import Dict, List, Optional, Tuple
 import numpy as np # type: ignore
 
 from matrx.goals import WorldGoal # type: ignore
@@ -10,12 +11,16 @@ class CollectionGoal(WorldGoal):
     The goal for BW4T world (the simulator), so determines
     when the simulator should stop.
     '''
-    def __init__(self, max_nr_ticks:int):
+    def __init__(self, max_nr_ticks:int, stall_ticks:int=None):
         '''
         @param max_nr_ticks the max number of ticks to be used for this task
+        @param stall_ticks if not None, also stop when for this number of ticks
+            the progress did not change, no agent moved or picked up or dropped
+            something, and no messages were sent.
         '''
         super().__init__()
         self.max_nr_ticks = max_nr_ticks
+        self.stall_ticks = stall_ticks
 
         # A dictionary of all drop locations. The keys is the drop zone number, the value another dict.
         # This dictionary contains as key the rank of the to be collected object and as value the location
@@ -27,27 +32,111 @@ class CollectionGoal(WorldGoal):
         # We also track the progress
         self.__progress = 0
 
+        # The collectable blocks on every drop tile, in the order of the world's
+        # environment objects. Kept up to date with objectsChanged, so that the
+        # goal does not have to search the world for blocks every tick.
+        self.__drop_tiles:Dict[tuple, List[EnvObject]] = {}
+        # True if the drop tiles changed since the last evaluation
+        self.__changed = True
+        # The last evaluation: the tick and whether the blocks were placed
+        self.__checked_tick:Optional[int] = None
+        self.__satisfied = False
+
+        # For the stall detection: the last seen state of the world,
+        # the tick it was first seen, and whether we gave up.
+        self.__last_state = None
+        self.__last_change = 0
+        self.__stalled = False
+
     #override
     def goal_reached(self, grid_world: GridWorld):
         if grid_world.current_nr_ticks >= self.max_nr_ticks:
             return True
-        return self.isBlocksPlaced(grid_world)
+        if self.isBlocksPlaced(grid_world):
+            return True
+        if self.stall_ticks is not None:
+            self.__stalled = self.__check_stall(grid_world)
+        return self.__stalled
+
+    def isStalled(self) -> bool:
+        '''
+        @return true if the world was stopped because nothing happened
+            for stall_ticks ticks.
+        '''
+        return self.__stalled
+
+    def __check_stall(self, grid_world:GridWorld) -> bool:
+        '''
+        @return true if the state of the world did not change in the last stall_ticks ticks.
+        '''
+        state = (self.__progress,
+                 # the number of ticks in which messages were sent
+                 len(grid_world.message_manager.preprocessed_messages),
+                 tuple((body.location, len(body.is_carrying))
+                       for body in grid_world.registered_agents.values()))
+        if state != self.__last_state:
+            self.__last_state = state
+            self.__last_change = grid_world.current_nr_ticks
+            return False
+        return grid_world.current_nr_ticks - self.__last_change >= self.stall_ticks
 
     def isBlocksPlaced(self, grid_world:GridWorld):
         '''
-        @return true if all blocks have been placed in right order
+        @return true if all blocks have been placed in right order.
+        Only evaluated again if blocks on the drop tiles changed, so
+        the goal and the logger can both call it every tick.
         '''
 
         if self.__drop_off =={}:  # find all drop off locations, its tile ID's and goal blocks
             self.__find_drop_off_locations(grid_world)
-
-        # Go through each drop zone, and check if the blocks are there in the right order
-        is_satisfied, progress = self.__check_completion(grid_world)
-
-        # Progress in percentage
-        self.__progress = progress / sum([len(goal_blocks)\
-            for goal_blocks in self.__drop_off.values()])
-        return is_satisfied
+            self.__index_drop_tiles(grid_world)
+        elif not getattr(grid_world, 'reports_object_changes', False) \
+                and grid_world.current_nr_ticks != self.__checked_tick:
+            # the world does not call objectsChanged, look at the drop tiles every tick
+            self.__index_drop_tiles(grid_world)
+        self.__checked_tick = grid_world.current_nr_ticks
+
+        if self.__changed:
+            # Go through each drop zone, and check if the blocks are there in the right order
+            self.__satisfied, progress = self.__check_completion(grid_world)
+
+            # Progress in percentage
+            self.__progress = progress / sum([len(goal_blocks)\
+                for goal_blocks in self.__drop_off.values()])
+            self.__changed = False
+        return self.__satisfied
+
+    def objectsChanged(self, changes:Dict[str, Tuple[Optional[tuple], Optional[tuple]]], grid_world:GridWorld):
+        '''
+        Tell the goal that objects were taken from or put into the world.
+        @param changes for every changed object id its location before and
+            after the change, None if the object was not in the world.
+        @param grid_world the world the objects are in
+        '''
+        if self.__drop_off == {}:
+            # we did not look at the world yet, the first isBlocksPlaced finds all blocks
+            return
+        for obj_id, (old_loc, new_loc) in changes.items():
+            if old_loc in self.__drop_tiles:
+                self.__drop_tiles[old_loc] = [block for block in self.__drop_tiles[old_loc] if block.obj_id != obj_id]
+                self.__changed = True
+            if new_loc in self.__drop_tiles:
+                obj = grid_world.environment_objects[obj_id]
+                if obj.properties.get("is_collectable"):
+                    self.__drop_tiles[new_loc].append(obj)
+                    self.__changed = True
+
+    def __index_drop_tiles(self, grid_world:GridWorld):
+        '''
+        find the collectable blocks on all drop tiles
+        '''
+        self.__drop_tiles = {block_data[0]: [] for goal_blocks in self.__drop_off.values()
+                             for block_data in goal_blocks.values()}
+        for obj in grid_world.environment_objects.values():
+            loc = tuple(obj.location)
+            if loc in self.__drop_tiles and obj.properties.get("is_collectable"):
+                self.__drop_tiles[loc].append(obj)
+        self.__changed = True
 
     def __find_drop_off_locations(self, grid_world:GridWorld):
 
@@ -102,12 +191,8 @@ class CollectionGoal(WorldGoal):
                 colour = block_data[2]  # the desired colour
                 tick = block_data[3]
 
-                # Retrieve all objects, the object ids at the location and obtain all BW4T Blocks from it
-                all_objs = grid_world.environment_objects
-                obj_ids = grid_world.get_objects_in_range(loc, object_type=EnvObject, sense_range=0)
-                blocks = [all_objs[obj_id] for obj_id in obj_ids
-                          if obj_id in all_objs.keys() and "is_collectable" in all_objs[obj_id].properties.keys()]
-                blocks = [b for b in blocks if b.properties["is_collectable"]]
+                # The BW4T Blocks at the location
+                blocks = self.__drop_tiles[loc]
 
                 # Check if there is a block, and if so if it is the right one and the tick is not yet set, then set the
                 # current tick.
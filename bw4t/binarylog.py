@@ -0,0 +1,182 @@
+'''
+Compact binary log format for the per-tick BW4T log, an alternative for
+the csv file. Every tick is one fixed size record of a numpy structured
+array, actions are stored as small integer codes. The file is a sequence of
+records: a kind byte, a little endian uint32 payload length and the payload.
+The kinds are
+H: json header with the columns and their numpy types, always first
+A: json list of action names, that get the next free action codes
+R: the raw bytes of a number of rows
+Rows are collected in chunks and written by a background thread, so the
+tick loop does not wait for the disk.
+This module does not depend on matrx, so logs can be read without it.
+'''
+from typing import Iterator, List, Optional, Tuple
+import json
+import queue
+import struct
+import threading
+
+import numpy as np # type: ignore
+
+BINARY_EXTENSION = '.bw4tlog'
+MAGIC = b'BW4TBIN1'
+_FRAME = struct.Struct('<cI')
+
+
+def columnType(name:str, value) -> str:
+    '''
+    @param name the column name
+    @param value the value of the column in the first row
+    @return the numpy type of the column
+    '''
+    if name.endswith('_acts'):
+        return '<i2'  # action code
+    if name.endswith('_msgs') or name.endswith('_drops') or name.endswith('_overruns'):
+        return '<i2'  # counts per tick
+    if isinstance(value, (bool, np.bool_)):
+        return '?'
+    if isinstance(value, (int, np.integer)):
+        return '<i4'
+    raise ValueError(f"Can not store column {name} with value {value!r} in a binary log")
+
+
+class BinaryLogWriter:
+    '''
+    Writes a binary log file. Call append for every row and close at the end.
+    '''
+    def __init__(self, filename:str, chunk_rows:int=256):
+        '''
+        @param filename the file to write, overwritten if it exists
+        @param chunk_rows the number of rows handed to the writer thread at once
+        '''
+        self._file = open(filename, 'wb')
+        self._file.write(MAGIC)
+        self._chunk_rows = chunk_rows
+        self._columns:List[str] = []
+        self._chunk:Optional[np.ndarray] = None
+        self._nrows = 0
+        # action name -> code. Code 0 is no action.
+        self._codes = {None: 0}
+        self._queue:queue.Queue = queue.Queue()
+        # the exception that stopped the writer thread, raised again by append and close
+        self._error:Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def append(self, row:dict):
+        '''
+        @param row dict with a value for every column. The columns are
+            fixed by the first row. Columns ending on _acts hold action names.
+        @raise the exception that stopped the writer thread, if it failed
+        '''
+        self._checkError()
+        if self._chunk is None:
+            self._columns = list(row.keys())
+            dtype = [(name, columnType(name, value)) for name, value in row.items()]
+            self._chunk = np.zeros(self._chunk_rows, dtype=dtype)
+            self._put(b'H', json.dumps({'columns': self._columns, 'dtype': dtype}).encode())
+        values = []
+        for name in self._columns:
+            value = row[name]
+            if name.endswith('_acts'):
+                value = self._code(value)
+            values.append(value)
+        self._chunk[self._nrows] = tuple(values)
+        self._nrows += 1
+        if self._nrows == self._chunk_rows:
+            self._flush()
+
+    def close(self):
+        '''
+        write the remaining rows and wait until everything is on disk.
+        The file is always closed.
+        @raise the exception that stopped the writer thread, if it failed
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._thread.is_alive():
+                self._flush()
+                self._queue.put(None)
+                self._thread.join()
+        finally:
+            self._file.close()
+        self._checkError()
+
+    def _code(self, action:Optional[str]) -> int:
+        if action not in self._codes:
+            self._codes[action] = len(self._codes)
+            self._put(b'A', json.dumps([action]).encode())
+        return self._codes[action]
+
+    def _flush(self):
+        if self._nrows > 0:
+            self._put(b'R', self._chunk[:self._nrows].tobytes())
+            self._nrows = 0
+
+    def _put(self, kind:bytes, payload:bytes):
+        self._queue.put(_FRAME.pack(kind, len(payload)) + payload)
+
+    def _write(self):
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    return
+                self._file.write(data)
+        except BaseException as e:
+            # the thread dies, the tick loop finds out on the next append or close
+            self._error = e
+
+    def _checkError(self):
+        if self._error is not None:
+            raise self._error
+
+
+def iterBinaryLog(filename:str) -> Iterator[Tuple[np.ndarray, List[str]]]:
+    '''
+    Read a binary log one chunk at a time.
+    @param filename a file written by BinaryLogWriter
+    @return iterator over (rows, actions): a structured array with the rows
+        of a chunk, and the action names where the action code is the index
+        in the list. Code 0 is ''. The list grows while reading.
+    '''
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not a binary BW4T log")
+        dtype = None
+        actions = ['']
+        while True:
+            frame = f.read(_FRAME.size)
+            if len(frame) < _FRAME.size:
+                break
+            kind, length = _FRAME.unpack(frame)
+            payload = f.read(length)
+            if len(payload) < length:
+                break  # the writer did not finish
+            if kind == b'H':
+                dtype = np.dtype([tuple(column) for column in json.loads(payload)['dtype']])
+            elif kind == b'A':
+                actions.extend(json.loads(payload))
+            elif kind == b'R':
+                if dtype is None:
+                    raise ValueError(f"{filename} has no header")
+                yield np.frombuffer(payload, dtype=dtype), actions
+
+
+def readBinaryLog(filename:str) -> Tuple[np.ndarray, List[str]]:
+    '''
+    @param filename a file written by BinaryLogWriter
+    @return the structured array with all rows, and the action names
+        where the action code is the index in the list. Code 0 is ''.
+    '''
+    chunks = []
+    actions = ['']
+    for rows, actions in iterBinaryLog(filename):
+        chunks.append(rows)
+    if not chunks:
+        raise ValueError(f"{filename} has no rows")
+    return np.concatenate(chunks), actions
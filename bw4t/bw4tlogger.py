@@ -1,5 +1,7 @@
 from matrx.logger.logger import GridWorldLogger # type: ignore
 
+from bw4t.binarylog import BINARY_EXTENSION, BinaryLogWriter
+
 
 class BW4TLogger(GridWorldLogger):
     '''
@@ -12,21 +14,31 @@ class BW4TLogger(GridWorldLogger):
 
     def log(self, grid_world, agent_data):
         # So agent_data is a dictionary of shape: {<agent id>: <result from agent's get_log_data>, ...}
-        # Knowing that it contains only a boolean, a number of messages, and the agent's name lets format it in some
-        # nice columns
+        # Knowing that it contains only a boolean, a number of messages, the agent's name and the time spent in the
+        # agent's hooks lets format it in some nice columns
         data = {}
         # simulation goal must be our CollectionGoal
         data['done'] = grid_world.simulation_goal.isBlocksPlaced(grid_world)
+        data['stalled'] = grid_world.simulation_goal.isStalled()
         for agent_id, log_data in agent_data.items():
 
             nmsgs=0
             dropped=0
+            filter_us=0
+            decide_us=0
+            overruns=0
             if len(log_data) > 0:
                 dropped = log_data["dropped_block"]
                 nmsgs = log_data["prev_tick_messages"]
+                filter_us = log_data["filter_us"]
+                decide_us = log_data["decide_us"]
+                overruns = log_data["overruns"]
 
             data[agent_id+'_msgs'] = nmsgs
             data[agent_id+'_drops'] = dropped
+            data[agent_id+'_filter_us'] = filter_us
+            data[agent_id+'_decide_us'] = decide_us
+            data[agent_id+'_overruns'] = overruns
 
 
         for agent_id, agent_body in grid_world.registered_agents.items():
@@ -40,4 +52,33 @@ class BW4TLogger(GridWorldLogger):
         @return the log filename written by this logger
         '''
         return self._GridWorldLogger__file_name
-    
\ No newline at end of file
+    
+
+class BW4TBinaryLogger(BW4TLogger):
+    '''
+    Logs the same as BW4TLogger, but in the binary format of bw4t.binarylog,
+    written by a background thread. Statistics can read both.
+    '''
+    def __init__(self, save_path="", file_name_prefix=""):
+        super().__init__(save_path=save_path, file_name_prefix=file_name_prefix, file_extension=BINARY_EXTENSION)
+        self._writer = None
+
+    #override
+    def _grid_world_log(self, grid_world, agent_data, last_tick=False, goal_status=None):
+        if not self._needs_to_log(grid_world, last_tick, goal_status):
+            return
+        data = self.log(grid_world, agent_data)
+        data['world_nr'] = self._GridWorldLogger__world_nr
+        data['tick_nr'] = grid_world.current_nr_ticks
+        if self._writer is None:
+            self._writer = BinaryLogWriter(self.getFileName())
+        self._writer.append(data)
+        if last_tick:
+            self.close()
+
+    def close(self):
+        '''
+        Write the remaining data to the file. Done automatically at the last tick.
+        '''
+        if self._writer is not None:
+            self._writer.close()
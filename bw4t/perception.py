@@ -0,0 +1,213 @@
+'''
+Faster ways for a BW4TGridWorld to make the states the agents perceive.
+The GridWorld rebuilds the properties of every object in range of every
+agent every tick, and finds them by checking all objects against every agent.
+
+StaticPerception builds the properties of the objects that never change
+(walls, area tiles, doors, ghost blocks) once for every agent.
+SpatialPerception also keeps the other objects in a uniform grid, so that
+an agent's ranged query only looks at the objects in the cells around it.
+Both make the same states as GridWorld, apart from the order of the objects.
+'''
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import math
+
+import numpy as np # type: ignore
+from matrx.objects import AreaTile, Door, Wall # type: ignore
+from matrx.utils import get_distance # type: ignore
+
+from bw4t.BW4TBlocks import GhostBlock
+
+# objects that never move and only change their properties by opening and closing doors
+STATIC_TYPES:tuple=(Wall, AreaTile, Door, GhostBlock)
+
+
+class StaticPerception:
+    '''
+    Makes the states of agents that perceive all objects of the STATIC_TYPES,
+    i.e. those fall under their unlimited "*" sense range. The properties of
+    these objects are made once for every agent and put in its state every
+    tick. Doors are rebuilt when they were opened or closed. The other objects
+    are checked against the agent's sense capabilities every tick.
+    '''
+    def __init__(self, grid_world):
+        '''
+        @param grid_world the BW4TGridWorld to perceive. Must be created
+            with all its objects, but need not be initialized.
+        '''
+        self._grid_world=grid_world
+        # agent id -> id -> properties of the static objects, made on the first state of the agent
+        self._static_states:Dict[str,Dict[str,dict]]={}
+        # the static objects, found on the first state
+        self._static_objects:Optional[Dict[str,object]]=None
+        self._doors:List[Door]=[]
+
+    def handles(self, capabilities:dict)->bool:
+        '''
+        @param capabilities the sense capabilities of an agent
+        @return true if this can make the state of an agent with these capabilities
+        '''
+        return capabilities.get('*')==np.inf and not any(obj_type!='*' and issubclass(obj_type, STATIC_TYPES)
+            for obj_type in capabilities)
+
+    def getState(self, agent_obj, capabilities:dict)->dict:
+        '''
+        @param agent_obj the AgentBody of the agent
+        @param capabilities the sense capabilities of the agent, see handles
+        @return the state of the agent, without the "World" entry
+        '''
+        if self._static_objects is None:
+            self._static_objects={obj_id:obj for obj_id,obj in self._grid_world.environment_objects.items()
+                if isinstance(obj, STATIC_TYPES)}
+            self._doors=[obj for obj in self._static_objects.values() if isinstance(obj, Door)]
+        static=self._static_states.get(agent_obj.obj_id)
+        if static is None:
+            # every agent gets its own dicts, as the agent may change them, e.g. BW4TBrain filtering colours
+            static={obj_id:obj.properties for obj_id,obj in self._static_objects.items()}
+            self._static_states[agent_obj.obj_id]=static
+        for door in self._doors:
+            if static[door.obj_id]['is_open']!=door.is_open:
+                static[door.obj_id]=door.properties
+
+        state=dict(static)
+        ranged={obj_type:sense_range for obj_type,sense_range in capabilities.items() if obj_type!='*'}
+        for obj_id,obj in self._perceived(agent_obj.location, ranged):
+            state[obj_id]=obj.properties
+        return state
+
+    def objectsChanged(self, changes:Dict[str,Tuple[Optional[tuple],Optional[tuple]]]):
+        '''
+        Tell that objects or agents moved, or were taken from or put into the world.
+        @param changes for every changed object id its location before and
+            after the change, None if the object was not in the world.
+        '''
+        pass
+
+    def _perceived(self, agent_loc:tuple, ranged:dict)->Iterator[Tuple[str,object]]:
+        '''
+        @param agent_loc the location of the agent
+        @param ranged object type -> sense range, the capabilities apart from "*"
+        @return (id, object) of the non static objects the agent perceives:
+            as GridWorld, the objects of a type in ranged within its range,
+            and all others
+        '''
+        static=self._static_objects
+        grid_world=self._grid_world
+        for objs in (grid_world.environment_objects, grid_world.registered_agents):
+            for obj_id,obj in objs.items():
+                if obj_id in static:
+                    continue
+                if type(obj) not in ranged or any(isinstance(obj, obj_type)
+                        and get_distance(obj.location, agent_loc)<=sense_range
+                        for obj_type,sense_range in ranged.items()):
+                    yield obj_id,obj
+
+
+class SpatialHash:
+    '''
+    Uniform grid of square cells, with the ids of the objects in each cell.
+    '''
+    def __init__(self, cell_size:int):
+        '''
+        @param cell_size the width and height of a cell, in tiles
+        '''
+        self._cell_size=cell_size
+        # cell -> ids of the objects in it, a dict to keep the order deterministic
+        self._cells:Dict[Tuple[int,int],Dict[str,None]]={}
+
+    def add(self, obj_id:str, loc:tuple):
+        self._cells.setdefault(self._cell(loc), {})[obj_id]=None
+
+    def remove(self, obj_id:str, loc:tuple):
+        cell=self._cells.get(self._cell(loc))
+        if cell is not None:
+            cell.pop(obj_id, None)
+
+    def query(self, loc:tuple, radius:float)->Iterator[str]:
+        '''
+        @return ids of the objects in the cells that overlap the square
+            around loc with the given radius. The caller checks the exact distance.
+        '''
+        x0,y0=self._cell((loc[0]-radius, loc[1]-radius))
+        x1,y1=self._cell((loc[0]+radius, loc[1]+radius))
+        cells=self._cells
+        for x in range(x0, x1+1):
+            for y in range(y0, y1+1):
+                cell=cells.get((x,y))
+                if cell:
+                    yield from cell
+
+    def _cell(self, loc:tuple)->Tuple[int,int]:
+        return (math.floor(loc[0]/self._cell_size), math.floor(loc[1]/self._cell_size))
+
+
+class SpatialPerception(StaticPerception):
+    '''
+    StaticPerception that keeps the non static objects in a SpatialHash,
+    and the objects of every type apart. Objects of a type with a limited
+    sense range are found in the cells around the agent. Must be told about
+    all moves and objects entering and leaving the world, see objectsChanged.
+    '''
+    def __init__(self, grid_world, cell_size:int=4):
+        '''
+        @param grid_world see StaticPerception
+        @param cell_size the width and height of a cell in tiles. About the
+            largest limited sense range works well.
+        '''
+        super().__init__(grid_world)
+        self._cell_size=cell_size
+        self._hash:Optional[SpatialHash]=None
+        # exact type -> ids of the non static objects in the world
+        self._by_type:Dict[type,Dict[str,None]]={}
+
+    def objectsChanged(self, changes:Dict[str,Tuple[Optional[tuple],Optional[tuple]]]):
+        if self._hash is None:
+            # we did not look at the world yet, the first state finds all objects
+            return
+        for obj_id,(old_loc,new_loc) in changes.items():
+            if old_loc is not None:
+                self._hash.remove(obj_id, old_loc)
+                if new_loc is None:
+                    for ids in self._by_type.values():
+                        ids.pop(obj_id, None)
+            if new_loc is not None:
+                obj=self._object(obj_id)
+                self._hash.add(obj_id, new_loc)
+                self._by_type.setdefault(type(obj), {})[obj_id]=None
+
+    def _perceived(self, agent_loc:tuple, ranged:dict)->Iterator[Tuple[str,object]]:
+        if self._hash is None:
+            self._index()
+        found:Set[str]=set()
+        # objects of a type without limited range are always perceived
+        for obj_type,ids in self._by_type.items():
+            if obj_type not in ranged:
+                for obj_id in ids:
+                    found.add(obj_id)
+                    yield obj_id,self._object(obj_id)
+        for obj_type,sense_range in ranged.items():
+            for obj_id in self._hash.query(agent_loc, sense_range):
+                if obj_id in found:
+                    continue
+                obj=self._object(obj_id)
+                if isinstance(obj, obj_type) and get_distance(obj.location, agent_loc)<=sense_range:
+                    found.add(obj_id)
+                    yield obj_id,obj
+
+    def _index(self):
+        '''
+        put all non static objects and agents in the hash
+        '''
+        self._hash=SpatialHash(self._cell_size)
+        self._by_type={}
+        grid_world=self._grid_world
+        for objs in (grid_world.environment_objects, grid_world.registered_agents):
+            for obj_id,obj in objs.items():
+                if obj_id in self._static_objects:
+                    continue
+                self._hash.add(obj_id, tuple(obj.location))
+                self._by_type.setdefault(type(obj), {})[obj_id]=None
+
+    def _object(self, obj_id:str):
+        agents=self._grid_world.registered_agents
+        return agents[obj_id] if obj_id in agents else self._grid_world.environment_objects[obj_id]
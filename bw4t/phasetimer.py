@@ -0,0 +1,130 @@
+'''
+Measures how the time of every tick of a GridWorld is spent, by wrapping
+the GridWorld methods of each phase. The durations of the last ticks are
+kept in a ring buffer and summarised at the end of the run.
+'''
+from typing import Callable, Dict, List
+import functools
+import time
+
+import numpy as np # type: ignore
+
+# The phases of a tick. 'other' is the rest of the GridWorld step,
+# e.g. the api bookkeeping, message passing and updating objects.
+PHASES:List[str] = ['perception', 'agents', 'actions', 'goal', 'logger', 'sleep', 'other']
+
+
+class PhaseTimer:
+    '''
+    Records per tick the seconds spent in each of the PHASES.
+    '''
+    def __init__(self, capacity:int=10000):
+        '''
+        @param capacity the number of ticks kept. Older ticks are overwritten.
+        '''
+        self._durations = np.zeros((capacity, len(PHASES)))
+        self._ticks = 0
+        self._current = np.zeros(len(PHASES))
+
+    def instrument(self, gridworld):
+        '''
+        Wrap the methods of the gridworld, its agents and loggers to measure
+        the phases. Must be called after all agents and loggers are added.
+        @param gridworld the GridWorld to measure
+        '''
+        # BW4TWorld checks that these private matrx methods exist, see MATRX_PRIVATE_METHODS
+        gridworld._GridWorld__step = self._tick(gridworld._GridWorld__step)
+        gridworld._GridWorld__get_agent_state = self.timed('perception', gridworld._GridWorld__get_agent_state)
+        gridworld._GridWorld__perform_action = self.timed('actions', gridworld._GridWorld__perform_action)
+        gridworld._GridWorld__check_simulation_goal = self.timed('goal', gridworld._GridWorld__check_simulation_goal)
+        gridworld._GridWorld__sleep = self.timed('sleep', gridworld._GridWorld__sleep)
+        for body in gridworld.registered_agents.values():
+            body.get_action_func = self.timed('agents', body.get_action_func)
+            body.filter_observations = self.timed('agents', body.filter_observations)
+        for logger in gridworld._GridWorld__loggers:
+            logger._grid_world_log = self.timed('logger', logger._grid_world_log)
+
+    def timed(self, phase:str, func:Callable) -> Callable:
+        '''
+        @return func, but adding its duration to the given phase of the current tick
+        '''
+        index = PHASES.index(phase)
+        current = self._current
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current[index] += time.perf_counter() - start
+        return wrapper
+
+    def _tick(self, step:Callable) -> Callable:
+        '''
+        @return step, but recording the phases of the tick it performs
+        '''
+        other = PHASES.index('other')
+        @functools.wraps(step)
+        def wrapper():
+            self._current[:] = 0
+            start = time.perf_counter()
+            try:
+                return step()
+            finally:
+                self._current[other] = time.perf_counter() - start - self._current.sum()
+                self._durations[self._ticks % len(self._durations)] = self._current
+                self._ticks += 1
+        return wrapper
+
+    def getDurations(self) -> np.ndarray:
+        '''
+        @return array with a row for each kept tick, oldest first, and a
+            column with the seconds spent in every phase of PHASES.
+        '''
+        capacity = len(self._durations)
+        if self._ticks <= capacity:
+            return self._durations[:self._ticks]
+        return np.roll(self._durations, -(self._ticks % capacity), axis=0)
+
+    def getSummary(self) -> Dict[str, Dict[str, float]]:
+        '''
+        @return for every phase the mean, p50, p90, p99 and max microseconds
+            per tick, and its share of the total time of the kept ticks.
+        '''
+        us = self.getDurations() * 1e6
+        total = us.sum()
+        res = {}
+        for index, phase in enumerate(PHASES):
+            column = us[:, index] if len(us) else np.zeros(1)
+            res[phase] = {
+                'mean': float(column.mean()),
+                'p50': float(np.percentile(column, 50)),
+                'p90': float(np.percentile(column, 90)),
+                'p99': float(np.percentile(column, 99)),
+                'max': float(column.max()),
+                'share': float(column.sum() / total) if total > 0 else 0.0,
+            }
+        return res
+
+    def histogram(self) -> str:
+        '''
+        @return text with the summary, and for every phase the number of
+            ticks per duration bucket. Bucket n counts the ticks in which the
+            phase took at most 2^n but more than 2^(n-1) microseconds.
+        '''
+        us = self.getDurations() * 1e6
+        lines = [f"phase timing over the last {len(us)} of {self._ticks} ticks, microseconds per tick"]
+        lines.append(f"{'phase':12}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'share':>8}")
+        for phase, stats in self.getSummary().items():
+            lines.append(f"{phase:12}{stats['mean']:10.1f}{stats['p50']:10.1f}{stats['p90']:10.1f}"
+                         f"{stats['p99']:10.1f}{stats['max']:10.1f}{100 * stats['share']:7.1f}%")
+        if len(us) == 0:
+            return '\n'.join(lines)
+        buckets = np.ceil(np.log2(np.maximum(us, 1))).astype(int)
+        top = int(buckets.max())
+        lines.append('histogram, ticks per bucket of at most 2^n us')
+        lines.append(f"{'phase':12}" + ''.join(f"{'<=' + str(2 ** n):>8}" for n in range(top + 1)))
+        for index, phase in enumerate(PHASES):
+            counts = np.bincount(buckets[:, index], minlength=top + 1)
+            lines.append(f"{phase:12}" + ''.join(f"{count:8d}" for count in counts))
+        return '\n'.join(lines)
@@ -0,0 +1,163 @@
+'''
+On-disk store of tournament session results, so that an interrupted
+tournament can be resumed and analysed without re-reading the csv logs.
+'''
+from typing import Dict, List, Sequence
+import hashlib
+import json
+import sqlite3
+
+import numpy as np # type: ignore
+
+from bw4t.BW4TWorld import OPTIONAL_WORLDSETTINGS
+
+# world settings that do not influence the outcome of a session,
+# and therefore are not part of the session key.
+RUNTIME_SETTINGS = {'headless', 'run_matrx_api', 'run_matrx_visualizer',
+                    'matrx_paused', 'verbose', 'tick_duration', 'log_format',
+                    'phase_timing', 'trace', 'static_perception',
+                    'spatial_perception', 'agent_info'}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    team TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    worldsettings TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    ticks INTEGER NOT NULL,
+    logfile TEXT,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_agents (
+    key TEXT NOT NULL REFERENCES sessions(key),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    botclass TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    PRIMARY KEY (key, position)
+);
+CREATE INDEX IF NOT EXISTS session_agents_name ON session_agents(name);
+'''
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, sort_keys=True, default=str)
+
+
+def sessionKey(spec:dict) -> str:
+    '''
+    @param spec a session spec, see bw4t.tournament.sessionSpecs
+    @return key that identifies the session by its team names,
+        the settings of each agent, the seed and the world settings.
+    '''
+    # a left out optional setting is the same as its default
+    worldsettings = dict(OPTIONAL_WORLDSETTINGS, **spec['worldsettings'])
+    worldsettings = {k: v for k, v in worldsettings.items() if k not in RUNTIME_SETTINGS}
+    key = _dumps({
+        'team': list(spec['team']),
+        'settings': [agent['settings'] for agent in spec['agents']],
+        'seed': spec['seed'],
+        'worldsettings': worldsettings,
+    })
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ResultStore:
+    '''
+    Sqlite database with one row per finished session.
+    '''
+    def __init__(self, filename:str):
+        '''
+        @param filename path of the database file, created if it does not exist.
+        '''
+        self._conn = sqlite3.connect(filename)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def contains(self, spec:dict) -> bool:
+        '''
+        @return true if the result of the given session spec is recorded
+        '''
+        row = self._conn.execute('SELECT 1 FROM sessions WHERE key=?', (sessionKey(spec),)).fetchone()
+        return row is not None
+
+    def missing(self, specs:List[dict]) -> List[dict]:
+        '''
+        @return the specs of which no result is recorded yet
+        '''
+        done = {row[0] for row in self._conn.execute('SELECT key FROM sessions')}
+        return [spec for spec in specs if sessionKey(spec) not in done]
+
+    def add(self, spec:dict, summary:dict):
+        '''
+        Record the result of a session. Committed immediately,
+        so it survives a crash of the tournament.
+        @param spec the session spec
+        @param summary the summary returned by bw4t.tournament.runSession
+        '''
+        key = sessionKey(spec)
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO sessions VALUES (?,?,?,?,?,?,?,?)',
+                (key, _dumps(list(spec['team'])), spec['seed'], _dumps(spec['worldsettings']),
+                 int(summary['success']), summary['ticks'], summary['filename'], _dumps(summary)))
+            self._conn.execute('DELETE FROM session_agents WHERE key=?', (key,))
+            self._conn.executemany('INSERT INTO session_agents VALUES (?,?,?,?,?)',
+                [(key, pos, agent['name'], agent['botclass'].__name__, _dumps(agent['settings']))
+                 for pos, agent in enumerate(spec['agents'])])
+
+    def summaries(self, specs:List[dict]) -> List[dict]:
+        '''
+        @return the recorded summaries of the given specs, with the
+            index of the spec. Specs without a result are skipped.
+        '''
+        res = []
+        for spec in specs:
+            row = self._conn.execute('SELECT summary FROM sessions WHERE key=?',
+                                     (sessionKey(spec),)).fetchone()
+            if row is not None:
+                summary = json.loads(row[0])
+                summary['index'] = spec['index']
+                summary['team'] = spec['team']
+                res.append(summary)
+        return res
+
+    def teamStats(self, percentiles:Sequence[int]=(50, 90)) -> List[Dict]:
+        '''
+        @param percentiles the tick percentiles to compute
+        @return for every team: nr of sessions, success rate, and the
+            mean and percentiles of the ticks of the successful sessions.
+        '''
+        return self._stats('SELECT team, success, ticks FROM sessions', percentiles)
+
+    def agentStats(self, percentiles:Sequence[int]=(50, 90)) -> List[Dict]:
+        '''
+        @return like teamStats, but for every agent name over all
+            sessions it took part in.
+        '''
+        return self._stats('SELECT a.name, s.success, s.ticks FROM sessions s '
+                           'JOIN session_agents a ON a.key=s.key', percentiles)
+
+    def _stats(self, query:str, percentiles:Sequence[int]) -> List[Dict]:
+        groups:Dict[str, dict] = {}
+        for name, success, ticks in self._conn.execute(query + ' ORDER BY 1'):
+            group = groups.setdefault(name, {'sessions': 0, 'successes': 0, 'ticks': []})
+            group['sessions'] += 1
+            if success:
+                group['successes'] += 1
+                group['ticks'].append(ticks)
+
+        res = []
+        for name, group in groups.items():
+            stats = {
+                'name': name,
+                'sessions': group['sessions'],
+                'success_rate': group['successes'] / group['sessions'],
+                'mean_ticks': float(np.mean(group['ticks'])) if group['ticks'] else None,
+            }
+            for p in percentiles:
+                stats[f"p{p}_ticks"] = float(np.percentile(group['ticks'], p)) if group['ticks'] else None
+            res.append(stats)
+        return res
@@ -1,15 +1,45 @@
-from typing import final, List, Dict, Final
+from typing import final, Iterator, List, Dict, Final, Optional
+from itertools import islice
+from multiprocessing import Pool
+import argparse
+import glob
+import json
 import sys
 import csv
 import os
 
+import numpy as np # type: ignore
+
+try:
+    from bw4t.binarylog import BINARY_EXTENSION, iterBinaryLog
+except ModuleNotFoundError:
+    # run as a script, python bw4t/statistics.py, puts bw4t itself on the path
+    from binarylog import BINARY_EXTENSION, iterBinaryLog # type: ignore
+
 MOVES=['MoveNorth','MoveNorthEast','MoveEast','MoveSouthEast',
        'MoveSouth','MoveSouthWest','MoveWest','MoveNorthWest']
+# the number of rows that is read and analysed at once
+CHUNK_ROWS=4096
+
+
+# the agent hooks that are timed, see BW4TBrain.get_log_data
+LATENCIES=['filter', 'decide']
+
+
+def isCount(column:str)->bool:
+    '''
+    @return true if the column holds a number per tick: the messages,
+    drops, microseconds spent in a hook or decision budget overruns of an agent
+    '''
+    return column.endswith('_msgs') or column.endswith('_drops') or column.endswith('_us') \
+        or column.endswith('_overruns')
+
 
 class Statistics:
     def __init__(self, filename:str):
         '''
-        @param filename the path to the csv file to read.
+        @param filename the path to the csv file to read, or to a binary
+        log (see bw4t.binarylog) if it has the BINARY_EXTENSION.
         It  is assumed that first row of the file contains the element headers
         and these are used as dict keys.
         header is assumed to have keys like 
@@ -18,94 +48,347 @@ class Statistics:
         agent1_344_acts;agent2_345_acts;human1_346_acts;world_nr;tick_nr
 
         done is True only in the last row.
+        stalled is True only in the last row of a session that was
+        stopped because nothing happened anymore. Older logs lack it.
         drops contains number of drops IN DROP ZONE.
+        filter_us and decide_us contain the microseconds the agent spent in
+        its filter and decide hooks, 0 if it was not called. Older logs lack them.
+        overruns contains the number of decisions over the agent's time budget.
+        Older logs lack it.
         '''
         self._filename=filename
-        self._contents=self._read()
-        self._analyse()
-        
-    def _read(self)->List[Dict[str,str]]:
+        self._header:List[str]=[]
+        # the last row, the only one that is kept
+        self._last:Dict[str,str]={}
+        self._moves:Dict[str,int]={}
+        self._messages:Dict[str,int]={}
+        self._drops:Dict[str,int]={}
+        self._overruns:Dict[str,int]={}
+        # agent -> hook -> list of arrays with the latencies of the calls
+        self._latencies:Dict[str,Dict[str,List[np.ndarray]]]={}
+        self._read()
+
+    def _read(self):
+        '''
+        read the file in one pass, in chunks of CHUNK_ROWS rows, and
+        analyse every chunk. Only the last row and the hook latencies
+        are kept.
         '''
-        read contents from csv file
-        @return it as list of dictionaries, one dictionary for each row.
+        chunks = self._readBinary() if self._filename.endswith(BINARY_EXTENSION) else self._readCsv()
+        for columns in chunks:
+            if self._last=={}:
+                agents=self.getAgents()
+                self._moves={agent:0 for agent in agents}
+                self._messages={agent:0 for agent in agents}
+                self._drops={agent:0 for agent in agents}
+                self._overruns={agent:0 for agent in agents}
+                self._latencies={agent:{hook:[] for hook in LATENCIES} for agent in agents}
+            self._analyse(columns)
+
+    def _readCsv(self)->Iterator[Dict[str,np.ndarray]]:
+        '''
+        read contents from csv file.
         It  is assumed that first row of the file contains the element headers
-        and these are used as dict keys.
-        The dict for each row contains the keys which are the element headers,
-        and the values which is the value in the column of that header
-        eg if file has header "name","id" and a row "jan,12" then the dict
-        for that row will be {'name':jan, 'id':12}.
+        and these are used as column names.
+        @return iterator over chunks of rows, as dict with for every
+        column name an array with the values in that column. The msgs and
+        drops columns are numbers, the other columns strings.
         '''
-        header:List[str]=[]
-        contents:List[Dict[str,str]]=[]
         with open(self._filename) as csvfile:
             reader = csv.reader(csvfile, delimiter=';', quotechar="'")
-            for row in reader:
-                if header==[]:
-                    header=row
-                    continue
-                res = {header[i]: row[i] for i in range(len(header))} 
-                contents.append(res)
-        return contents
+            self._header=next(reader, [])
+            while True:
+                rows = list(islice(reader, CHUNK_ROWS))
+                if len(rows)==0:
+                    return
+                yield {name: np.array(column, dtype=np.int64 if isCount(name) else str)
+                       for name, column in zip(self._header, zip(*rows))}
+
+    def _readBinary(self)->Iterator[Dict[str,np.ndarray]]:
+        '''
+        read contents from a binary log
+        @return iterator like _readCsv, but the columns have the types of
+        the binary log. The action codes are translated into action names.
+        '''
+        for rows, actions in iterBinaryLog(self._filename):
+            self._header=list(rows.dtype.names)
+            names=np.array(actions)
+            yield {name: names[rows[name]] if name.endswith('_acts') else rows[name]
+                   for name in self._header}
 
-    def _analyse(self):
+    def _analyse(self, columns:Dict[str,np.ndarray]):
         '''
-        analyse the performance log dictionary contained in _contents.
-        Dict is assumed to have keys like 
+        analyse a chunk of the performance log.
+        @param columns dict with for every column the values in this chunk.
+        Columns are assumed to be like 
         done;agent1_344_msgs;agent1_344_drops;agent2_345_msgs;
         agent2_345_drops;human1_346_msgs;human1_346_drops;
         agent1_344_acts;agent2_345_acts;human1_346_acts;world_nr;tick_nr
  
         '''
-        agents=self.getAgents()
-        self._moves={agent:0 for agent in agents}
-        self._messages={agent:0 for agent in agents}
-        self._drops={agent:0 for agent in agents}
-        for row in self._contents:
-            for agent in agents:
-                if row[agent+'_acts']  in MOVES:
-                    self._moves[agent] += 1
-                self._messages[agent] += int(row[agent+'_msgs'])
-                self._drops[agent] += int(row[agent+'_drops'])
-                
+        for agent in self._moves.keys():
+            self._moves[agent] += int(np.isin(columns[agent+'_acts'], MOVES).sum())
+            self._messages[agent] += int(columns[agent+'_msgs'].sum())
+            self._drops[agent] += int(columns[agent+'_drops'].sum())
+            if agent+'_overruns' in columns:
+                self._overruns[agent] += int(columns[agent+'_overruns'].sum())
+            for hook in LATENCIES:
+                column=columns.get(agent+'_'+hook+'_us')
+                if column is not None:
+                    self._latencies[agent][hook].append(column[column>0].astype(np.int32))
+        self._last={name: str(column[-1]) for name, column in columns.items()}
+
     def getLastTick(self):
         '''
         @return tick nr of last line
         '''
-        return self._contents[-1]['tick_nr']        
+        return self._last['tick_nr']        
     
     def isSucces(self):
         '''
         return 'done' field of last row 
         '''
-        return self._contents[len(self._contents)-1]['done']
+        return self._last['done']
     
+    def isStalled(self)->bool:
+        '''
+        @return true if the session was stopped because it stalled,
+        false if it succeeded, ran into the deadline or the log has no stalled column.
+        '''
+        return self._last.get('stalled')=='True'
+
     def getAgents(self):
         '''
         @return list of agents in the contents
         '''
-        if len(self._contents)==0:
-            return []
         agents =[]
-        for header in self._contents[0].keys():
+        for header in self._header:
             if header.endswith("_acts"):
                 agents.append(header[:len(header)-5])
         return agents
-                
-    
+
+    def getLatencies(self)->Dict[str,Dict[str,Dict[str,int]]]:
+        '''
+        @return for every agent and hook (see LATENCIES) the p50, p95 and max
+        of the microseconds per call, over the ticks in which the hook was
+        called. Empty for logs without latency columns.
+        '''
+        res:Dict[str,Dict[str,Dict[str,int]]]={}
+        for agent, hooks in self._latencies.items():
+            for hook, chunks in hooks.items():
+                values=np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+                if len(values)==0:
+                    continue
+                res.setdefault(agent, {})[hook]={
+                    'p50': int(np.percentile(values, 50)),
+                    'p95': int(np.percentile(values, 95)),
+                    'max': int(values.max()),
+                }
+        return res
+
+    def getSummary(self)->dict:
+        '''
+        @return small dict with the results of this log, without the
+        row contents. Suited to be sent between processes.
+        '''
+        return {
+            'filename': self._filename,
+            'agents': self.getAgents(),
+            'success': self.isSucces()=='True',
+            'stalled': self.isStalled(),
+            'ticks': int(self.getLastTick()),
+            'messages': self._messages,
+            'drops': self._drops,
+            'moves': self._moves,
+            'latency': self.getLatencies(),
+            'overruns': self._overruns,
+        }
+
     def __str__(self):
         return "Statistics for "+self._filename\
             +"\nagents:"+str(self.getAgents())\
             +"\nsuccess:"+str(self.isSucces())\
+            +"\nstalled:"+str(self.isStalled())\
             +"\nmessages:"+str(self._messages)\
             +"\ndrops:"+str(self._drops)\
             +"\nmoves:"+str(self._moves)\
             +"\ntotal moves:"+str(sum(self._moves.values()))\
+            +"\nlatency (us):"+str(self.getLatencies())\
+            +"\nbudget overruns:"+str(self._overruns)\
             +"\nlast tick:"+str(self.getLastTick())
         
+def agentInfoFilename(logfile:str)->str:
+    '''
+    @param logfile a log file
+    @return the file next to it that tells the class and settings of its
+    agents. BW4TWorld writes it, the log itself only has agent ids.
+    '''
+    return os.path.splitext(logfile)[0]+'.agents.json'
+
+
+def blindness(settings:dict)->str:
+    '''
+    @return 'none', 'colour', 'shape' or 'both': what the agent with these settings can not see
+    '''
+    # the tournament spells it colourblind, BW4TBrain colorblind
+    colour=settings.get('colourblind', settings.get('colorblind', False))
+    shape=settings.get('shapeblind', False)
+    return {(False,False):'none', (True,False):'colour', (False,True):'shape', (True,True):'both'}[(colour,shape)]
+
+
+def findLogs(paths:List[str])->List[str]:
+    '''
+    @param paths log files, directories or glob patterns
+    @return all log files given, or found in the directories (recursively) or matching the patterns
+    '''
+    files=[]
+    for path in paths:
+        if os.path.isdir(path):
+            for extension in ('.csv', BINARY_EXTENSION):
+                files.extend(glob.glob(os.path.join(path, '**', '*'+extension), recursive=True))
+        else:
+            files.extend(glob.glob(path, recursive=True))
+    return sorted(set(files))
+
+
+def summarize(filename:str)->Optional[dict]:
+    '''
+    @param filename a log file
+    @return the summary of the log with the agent info, under 'agentinfo'
+    (empty if there is no agent info file), or None if the log can not be read.
+    '''
+    try:
+        summary=Statistics(filename).getSummary()
+    except (KeyError, ValueError, IndexError) as e:
+        print(f"skipping {filename}: {e!r}", file=sys.stderr)
+        return None
+    summary['agentinfo']={}
+    infofile=agentInfoFilename(filename)
+    if os.path.exists(infofile):
+        with open(infofile) as f:
+            summary['agentinfo']=json.load(f)
+    return summary
+
+
+def analyseFiles(files:List[str], workers:int=1, cachefile:Optional[str]=None)->List[dict]:
+    '''
+    Summarize many logs.
+    @param files the log files
+    @param workers number of worker processes
+    @param cachefile json file with the summaries of earlier calls, by
+    path and modification time. Updated with the new summaries, and pruned of
+    the summaries of logs that were removed or changed since. None for no cache.
+    @return the summaries of the files that could be read, see summarize
+    '''
+    cache:Dict[str,dict]={}
+    if cachefile is not None and os.path.exists(cachefile):
+        with open(cachefile) as f:
+            cache=json.load(f)
+    keys={filename: _cacheKey(filename) for filename in files}
+    stale=[key for key in cache if not _isCurrent(key)]
+    for key in stale:
+        del cache[key]
+    todo=[filename for filename in files if keys[filename] not in cache]
+    if workers>1 and len(todo)>1:
+        with Pool(processes=workers) as pool:
+            summaries=pool.map(summarize, todo, chunksize=max(1, len(todo)//(4*workers)))
+    else:
+        summaries=[summarize(filename) for filename in todo]
+    for filename, summary in zip(todo, summaries):
+        if summary is not None:
+            cache[keys[filename]]=summary
+    if cachefile is not None and (todo or stale):
+        with open(cachefile, 'w') as f:
+            json.dump(cache, f)
+    return [cache[keys[filename]] for filename in files if keys[filename] in cache]
+
+
+def _cacheKey(filename:str)->str:
+    '''
+    @return key of the summary of the log in the cache of analyseFiles
+    '''
+    return os.path.abspath(filename)+'@'+str(os.path.getmtime(filename))
+
+
+def _isCurrent(key:str)->bool:
+    '''
+    @param key a key in the cache of analyseFiles
+    @return true if the log of the key still exists and was not changed since
+    '''
+    filename=key.rsplit('@', 1)[0]
+    return os.path.isfile(filename) and _cacheKey(filename)==key
+
+
+def aggregate(summaries:List[dict])->List[dict]:
+    '''
+    @param summaries log summaries, see summarize
+    @return for every agent class and blindness: the nr of sessions, success
+    rate, ticks of the successful sessions (mean, p50, p90), and moves and
+    messages per delivered block. Agents without agent info are grouped by
+    their name, with blindness 'unknown'.
+    '''
+    groups:Dict[tuple,dict]={}
+    for summary in summaries:
+        for agent in summary['agents']:
+            name=agent.rsplit('_', 1)[0]  # agent ids are <name>_<nr>
+            info=summary['agentinfo'].get(name)
+            key=(info['botclass'], blindness(info['settings'])) if info else (name, 'unknown')
+            group=groups.setdefault(key, {'sessions':0, 'successes':0, 'ticks':[], 'moves':0, 'messages':0, 'drops':0})
+            group['sessions']+=1
+            if summary['success']:
+                group['successes']+=1
+                group['ticks'].append(summary['ticks'])
+            group['moves']+=summary['moves'][agent]
+            group['messages']+=summary['messages'][agent]
+            group['drops']+=summary['drops'][agent]
+
+    res=[]
+    for (botclass, blind), group in sorted(groups.items()):
+        ticks=np.array(group['ticks'])
+        res.append({
+            'botclass': botclass,
+            'blindness': blind,
+            'sessions': group['sessions'],
+            'success_rate': group['successes']/group['sessions'],
+            'mean_ticks': float(ticks.mean()) if len(ticks) else None,
+            'p50_ticks': float(np.percentile(ticks, 50)) if len(ticks) else None,
+            'p90_ticks': float(np.percentile(ticks, 90)) if len(ticks) else None,
+            'moves_per_block': group['moves']/group['drops'] if group['drops'] else None,
+            'messages_per_block': group['messages']/group['drops'] if group['drops'] else None,
+        })
+    return res
+
+
+def printTable(rows:List[dict]):
+    '''
+    print the result of aggregate as a table
+    '''
+    columns=['botclass', 'blindness', 'sessions', 'success_rate', 'mean_ticks', 'p50_ticks', 'p90_ticks',
+             'moves_per_block', 'messages_per_block']
+    def fmt(value):
+        if value is None:
+            return '-'
+        return f"{value:.2f}" if isinstance(value, float) else str(value)
+    cells=[columns]+[[fmt(row[column]) for column in columns] for row in rows]
+    widths=[max(len(line[i]) for line in cells) for i in range(len(columns))]
+    for line in cells:
+        print('  '.join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+
 if __name__ == "__main__":
-    if len(sys.argv)!=2:
-        raise ValueError("usage: "+sys.argv[0]+" <filename>")
-    print (os.getcwd())
-    print(Statistics(sys.argv[1]))
-    
-    
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Analyse BW4T logs. With a single log file "
+        "prints its statistics, otherwise a table per agent class and blindness")
+    parser.add_argument('paths', nargs='+', help="log files, directories or glob patterns")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--cache', default=None,
+                        help="json file to cache the log summaries in, e.g. inside the log directory. "
+                        "Without it nothing is cached")
+    args = parser.parse_args()
+    if len(args.paths)==1 and os.path.isfile(args.paths[0]):
+        print (os.getcwd())
+        print(Statistics(args.paths[0]))
+    else:
+        files=findLogs(args.paths)
+        summaries=analyseFiles(files, workers=args.workers, cachefile=args.cache or None)
+        print(f"{len(summaries)} of {len(files)} logs analysed")
+        printTable(aggregate(summaries))
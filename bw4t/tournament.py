@@ -0,0 +1,333 @@
+'''
+Support for running tournaments: a tournament is a list of session specs,
+each spec fully describing one BW4TWorld run. Specs can be run one after
+another or in a pool of worker processes. Every session is seeded the same
+no matter which process runs it, but agents that depend on e.g. object
+identities can still behave a bit differently from run to run.
+'''
+from itertools import combinations, combinations_with_replacement
+from multiprocessing import Pool
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+import json
+import math
+import os
+import random
+import time
+
+import matrx.objects.env_object as env_object # type: ignore
+import numpy as np # type: ignore
+
+from bw4t.BW4TWorld import BW4TWorldFactory
+from bw4t.resultstore import RUNTIME_SETTINGS
+from bw4t.statistics import Statistics
+
+# every process builds the world layout only once per worldsettings
+_factory = BW4TWorldFactory()
+
+
+def isSolvable(settingcombi) -> bool:
+    '''
+    @return true if at least 1 agent can see colours and 1 agent can see shapes.
+    '''
+    color_visible = False
+    shape_visible = False
+    for setting in settingcombi:
+        if not setting['shapeblind']:
+            shape_visible = True
+        if not setting['colourblind']:
+            color_visible = True
+    return color_visible and shape_visible
+
+
+def sessionSpecs(agents:List[dict], agent_settings:List[dict], teamsize:int,
+        worldsettings:dict, logdir:str='.', vary_seed:bool=False) -> List[dict]:
+    '''
+    Enumerate all sessions of a tournament: every team of teamsize agents
+    is combined with every solvable combination of agent_settings.
+    @param agents list of agents, as in BW4TWorld. The settings are ignored
+    @param agent_settings list of possible settings for the agents
+    @param teamsize the number of agents in a team
+    @param worldsettings the world settings for every session
+    @param logdir the directory in which every session gets its own log directory
+    @param vary_seed if false, every session uses worldsettings['random_seed'],
+        like the serial tournament did. If true, session i gets seed random_seed+i
+    @return list of session specs, dicts with keys index, team (tuple of agent names),
+        agents (agents with their settings assigned), seed, worldsettings and logdir.
+    '''
+    specs = []
+    for team in combinations(agents, teamsize):
+        for settingcombi in combinations_with_replacement(agent_settings, teamsize):
+            if not isSolvable(settingcombi):
+                continue
+            index = len(specs)
+            seed = worldsettings['random_seed'] + (index if vary_seed else 0)
+            settings = worldsettings.copy()
+            settings['random_seed'] = seed
+            specs.append({
+                'index': index,
+                'team': tuple(agent['name'] for agent in team),
+                # assign settings to agents by position
+                'agents': [{'name': agent['name'], 'botclass': agent['botclass'], 'settings': setting}
+                           for agent, setting in zip(team, settingcombi)],
+                'seed': seed,
+                'worldsettings': settings,
+                'logdir': os.path.join(logdir, f"session_{index}"),
+            })
+    return specs
+
+
+def canonicalKey(spec:dict) -> str:
+    '''
+    @param spec a session spec, see sessionSpecs
+    @return key that is the same for equivalent sessions: the same ordered
+        list of (botclass, settings) pairs, world settings and seed. The order
+        matters, as BW4TWorld places the agents by their position in the list.
+        Only the agent names are ignored. They also make the agent ids, so
+        sessions with other names are only equivalent for agents that do not
+        depend on the exact ids, e.g. to break ties.
+    '''
+    agents = [[agent['botclass'].__module__ + '.' + agent['botclass'].__qualname__, agent['settings']]
+              for agent in spec['agents']]
+    worldsettings = {k: v for k, v in spec['worldsettings'].items() if k not in RUNTIME_SETTINGS}
+    return json.dumps({'agents': agents, 'worldsettings': worldsettings, 'seed': spec['seed']},
+                      sort_keys=True, default=str)
+
+
+def dedupe(specs:List[dict]) -> Tuple[List[dict], Dict[int, List[dict]]]:
+    '''
+    @param specs the session specs
+    @return (distinct, equivalents) where distinct has the first spec of
+        every group of equivalent specs, and equivalents maps the index of
+        such a first spec to all specs of its group, itself included.
+    '''
+    groups:Dict[str, List[dict]] = {}
+    for spec in specs:
+        groups.setdefault(canonicalKey(spec), []).append(spec)
+    distinct = [group[0] for group in groups.values()]
+    return distinct, {group[0]['index']: group for group in groups.values()}
+
+
+def fanOut(summary:dict, equivalents:Dict[int, List[dict]]) -> List[dict]:
+    '''
+    @param summary summary of a distinct spec, as returned by runSession
+    @param equivalents as returned by dedupe
+    @return a copy of the summary for every spec equivalent to the one
+        that ran, with the index, team and settings of that spec.
+        The per agent counts keep the agent ids of the session that ran.
+    '''
+    res = []
+    for spec in equivalents[summary['index']]:
+        copy = dict(summary)
+        copy['index'] = spec['index']
+        copy['team'] = spec['team']
+        copy['settings'] = [agent['settings'] for agent in spec['agents']]
+        res.append(copy)
+    return res
+
+
+def runSession(spec:dict) -> dict:
+    '''
+    Run a single session and analyse its log.
+    @param spec a session spec, see sessionSpecs
+    @return the Statistics summary of the session, extended with
+        the index, team, settings and seed of the spec, and ready_at:
+        the time.time() at which the world was ready to run.
+    '''
+    # matrx numbers all objects with a global counter, and agents use their
+    # id to seed their choices. Reset it so that a session behaves the same
+    # no matter which sessions ran before it in this process.
+    env_object.object_counter = 0
+
+    # the agent info lets the batch mode of bw4t.statistics group the logs by agent class
+    world = _factory.create(spec['agents'], dict(spec['worldsettings'], agent_info=True), logdir=spec['logdir'])
+    # seed after creating the world, building a new world layout also draws random numbers
+    random.seed(spec['seed'])
+    ready_at = time.time()
+    world.run()
+    summary = Statistics(world.getLogger().getFileName()).getSummary()
+    summary['index'] = spec['index']
+    summary['team'] = spec['team']
+    summary['settings'] = [agent['settings'] for agent in spec['agents']]
+    summary['seed'] = spec['seed']
+    summary['ready_at'] = ready_at
+    return summary
+
+
+def warmUp(specs:List[dict]):
+    '''
+    Build the world layouts of the given sessions in this process,
+    so that processes forked from it do not have to.
+    '''
+    for spec in specs:
+        _factory.prepare(spec['worldsettings'])
+
+
+def runSessions(specs:List[dict], workers:int=1) -> Iterator[dict]:
+    '''
+    Run all given sessions.
+    @param specs the session specs to run
+    @param workers number of worker processes. With 1 the sessions run
+        in this process, one after another.
+    @return iterator over the session summaries, in order of completion.
+    '''
+    if workers <= 1:
+        for spec in specs:
+            yield runSession(spec)
+        return
+    with Pool(processes=workers) as pool:
+        for summary in pool.imap_unordered(runSession, specs, chunksize=1):
+            yield summary
+
+
+def aggregate(summaries:List[dict], our_name:str) -> Tuple[List[dict], dict]:
+    '''
+    @param summaries the session summaries, as returned by runSession
+    @param our_name name of our agent
+    @return (res, our) where res is a list with for every team the agents,
+        success_rate, avg_ticks and the nr of stalled sessions, and our is a dict with count, total
+        and ticks for the sessions that contain our agent.
+        Like the serial tournament, ticks only count successful sessions.
+    '''
+    teams:dict = {}
+    our = {'count': 0, 'total': 0, 'ticks': 0}
+    for summary in sorted(summaries, key=lambda s: s['index']):
+        team = teams.setdefault(summary['team'], {'successes': 0, 'ticks': 0, 'total': 0, 'stalled': 0})
+        contains_our = our_name in summary['team']
+        team['total'] += 1
+        team['stalled'] += summary.get('stalled', False)
+        our['total'] += contains_our
+        if summary['success']:
+            team['successes'] += 1
+            team['ticks'] += summary['ticks']
+            our['count'] += contains_our
+            our['ticks'] += contains_our * summary['ticks']
+
+    res = [{
+        'agents': names,
+        'success_rate': str(team['successes']) + '/' + str(team['total']),
+        'avg_ticks': str(team['ticks'] / team['total']),
+        'stalled': team['stalled'],
+    } for names, team in teams.items()]
+    return res, our
+
+
+def seedSpec(spec:dict, sample:int, index:int) -> dict:
+    '''
+    @param spec a session spec, see sessionSpecs
+    @param sample the sample nr, the new spec gets seed spec['seed']+sample
+    @param index the index of the new spec
+    @return copy of spec that runs the same cell with another seed
+    '''
+    seed = spec['seed'] + sample
+    settings = spec['worldsettings'].copy()
+    settings['random_seed'] = seed
+    return dict(spec, index=index, seed=seed, worldsettings=settings,
+                cell=spec['index'], logdir=f"{spec['logdir']}_{sample}")
+
+
+def wilsonInterval(successes:int, n:int, z:float=1.96) -> Tuple[float, float]:
+    '''
+    @return Wilson score interval of a success rate. Unlike the plain normal
+        interval it is not empty when all or none of the samples succeeded.
+    '''
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    halfwidth = z / (1 + z * z / n) * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return max(0.0, center - halfwidth), min(1.0, center + halfwidth)
+
+
+def meanInterval(values:List[float], z:float=1.96) -> Tuple[float, float, float]:
+    '''
+    @return mean, low and high of the normal confidence interval of the mean.
+        The interval is unbounded with less than 2 values.
+    '''
+    if len(values) < 2:
+        mean = float(values[0]) if values else math.nan
+        return mean, -math.inf, math.inf
+    mean = float(np.mean(values))
+    halfwidth = z * float(np.std(values, ddof=1)) / math.sqrt(len(values))
+    return mean, mean - halfwidth, mean + halfwidth
+
+
+def cellResult(spec:dict, summaries:List[dict], z:float=1.96) -> dict:
+    '''
+    @param spec the session spec of the cell
+    @param summaries the summaries of all seeds run for the cell
+    @return dict with team, settings, samples, success_rate, success_interval,
+        mean_ticks, ticks_interval and the nr of stalled sessions. Ticks are the last tick of every
+        session, so failed sessions count with their deadline.
+    '''
+    successes = sum(1 for summary in summaries if summary['success'])
+    mean, low, high = meanInterval([summary['ticks'] for summary in summaries], z)
+    return {
+        'index': spec['index'],
+        'team': spec['team'],
+        'settings': [agent['settings'] for agent in spec['agents']],
+        'samples': len(summaries),
+        'success_rate': successes / len(summaries) if summaries else math.nan,
+        'success_interval': wilsonInterval(successes, len(summaries), z),
+        'mean_ticks': mean,
+        'ticks_interval': (low, high),
+        'stalled': sum(1 for summary in summaries if summary.get('stalled', False)),
+    }
+
+
+def runSequential(specs:List[dict], runner:Callable[[List[dict]], Iterable[dict]]=runSessions,
+        min_seeds:int=5, max_seeds:int=20, success_halfwidth:float=0.25,
+        ticks_halfwidth:float=0.2, z:float=1.96) -> List[dict]:
+    '''
+    Run every cell (session spec) with seeds seed, seed+1, ... until its
+    results are settled or it ran max_seeds seeds. All cells that are not
+    settled yet run one more seed per round, so the rounds can use workers.
+    A cell is settled when it ran min_seeds seeds, the confidence interval
+    of its success rate is at most 2*success_halfwidth wide, and the one of
+    its mean ticks at most 2*ticks_halfwidth times the mean ticks.
+    The success interval is widest for a success rate of 0.5, so with a
+    smaller success_halfwidth than wilsonInterval gives there for max_seeds
+    samples, such cells can never settle (see maxSuccessHalfwidth).
+    @param specs the session specs of the cells, see sessionSpecs
+    @param runner function that runs a list of specs and returns their
+        summaries in any order, like runSessions
+    @param z the z-value of the confidence intervals, 1.96 gives 95%
+    @return for every cell the cellResult, plus 'settled'.
+    '''
+    summaries:dict = {spec['index']: [] for spec in specs}
+    open_cells = list(specs)
+    for sample in range(max_seeds):
+        if not open_cells:
+            break
+        todo = [seedSpec(spec, sample, spec['index'] * max_seeds + sample) for spec in open_cells]
+        for summary in runner(todo):
+            summaries[summary['index'] // max_seeds].append(summary)
+        open_cells = [spec for spec in open_cells
+                      if not _isSettled(cellResult(spec, summaries[spec['index']], z),
+                                        min_seeds, success_halfwidth, ticks_halfwidth)]
+
+    res = []
+    for spec in specs:
+        result = cellResult(spec, summaries[spec['index']], z)
+        result['settled'] = _isSettled(result, min_seeds, success_halfwidth, ticks_halfwidth)
+        res.append(result)
+    return res
+
+
+def maxSuccessHalfwidth(n:int, z:float=1.96) -> float:
+    '''
+    @return the largest half-width of the success interval after n samples,
+        the one of a success rate of 0.5. A cell that ran n seeds has a
+        success interval at most this wide.
+    '''
+    if n == 0:
+        return 0.5
+    # the halfwidth of wilsonInterval for p = 0.5, its interval is centered at 0.5 and never clipped
+    return z / (1 + z * z / n) * math.sqrt(0.25 / n + z * z / (4 * n * n))
+
+
+def _isSettled(result:dict, min_seeds:int, success_halfwidth:float, ticks_halfwidth:float) -> bool:
+    low, high = result['success_interval']
+    ticks_low, ticks_high = result['ticks_interval']
+    return result['samples'] >= min_seeds \
+        and high - low <= 2 * success_halfwidth \
+        and ticks_high - ticks_low <= 2 * ticks_halfwidth * result['mean_ticks']
@@ -0,0 +1,118 @@
+'''
+Records a session as trace events, the json format of chrome://tracing
+and Perfetto. There is a span for every tick, nested in it a span for
+every agent with its filter_observations and decide_on_action, and instant
+events for messages, grabs and drops.
+'''
+from typing import Callable, List
+import functools
+import inspect
+import json
+import time
+
+from matrx.actions.object_actions import DropObject, GrabObject # type: ignore
+
+# the actions that get an instant event
+TRACED_ACTIONS = {GrabObject.__name__, DropObject.__name__}
+
+
+class Tracer:
+    '''
+    Collects the trace events of one GridWorld run.
+    '''
+    def __init__(self):
+        self._events:List[dict] = []
+        self._start = time.perf_counter()
+        self._tick = 0
+
+    def instrument(self, gridworld):
+        '''
+        Wrap the methods of the gridworld and its agents to record events.
+        Must be called after all agents are added.
+        @param gridworld the GridWorld to trace
+        '''
+        # BW4TWorld checks that these private matrx methods exist, see MATRX_PRIVATE_METHODS
+        gridworld._GridWorld__step = self._span(lambda: f"tick {self._tick}", 'tick',
+                                                self._countTick(gridworld._GridWorld__step))
+        gridworld._GridWorld__perform_action = self._actions(gridworld._GridWorld__perform_action)
+        for agent_id, body in gridworld.registered_agents.items():
+            # the agent's brain, the callback is its bound method (maybe wrapped, e.g. by a PhaseTimer)
+            brain = inspect.unwrap(body.get_action_func).__self__
+            brain.filter_observations = self._span(lambda: 'filter_observations', 'agent', brain.filter_observations)
+            brain.decide_on_action = self._span(lambda: 'decide_on_action', 'agent', brain.decide_on_action)
+            body.get_action_func = self._span(lambda agent_id=agent_id: agent_id, 'agent', body.get_action_func)
+            # On ticks the agent is busy, GridWorld only calls body.filter_observations. matrx makes that the
+            # brain's _fetch_state, which calls the wrapped brain.filter_observations above, so busy ticks get
+            # their nested filter_observations span too. Any other callback gets the nested span here.
+            observe = body.filter_observations
+            if inspect.unwrap(observe) != brain._fetch_state:
+                observe = self._span(lambda: 'filter_observations', 'agent', observe)
+            body.filter_observations = self._span(lambda agent_id=agent_id: agent_id, 'agent', observe)
+            body.get_messages_func = self._messages(agent_id, body.get_messages_func)
+
+    def write(self, filename:str):
+        '''
+        write the events to a trace-event json file
+        '''
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self._events, 'displayTimeUnit': 'ms'}, f)
+
+    def _now(self) -> float:
+        '''
+        @return microseconds since the start of the trace
+        '''
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _instant(self, name:str, args:dict):
+        self._events.append({'name': name, 'cat': 'event', 'ph': 'i', 's': 't',
+                             'ts': self._now(), 'pid': 0, 'tid': 0, 'args': args})
+
+    def _span(self, name:Callable[[], str], category:str, func:Callable) -> Callable:
+        '''
+        @param name function giving the name of the span when it starts
+        @return func, but recording a complete event for every call
+        '''
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            event = {'name': name(), 'cat': category, 'ph': 'X', 'ts': self._now(), 'pid': 0, 'tid': 0}
+            try:
+                return func(*args, **kwargs)
+            finally:
+                event['dur'] = self._now() - event['ts']
+                self._events.append(event)
+        return wrapper
+
+    def _countTick(self, step:Callable) -> Callable:
+        @functools.wraps(step)
+        def wrapper():
+            try:
+                return step()
+            finally:
+                self._tick += 1
+        return wrapper
+
+    def _actions(self, perform_action:Callable) -> Callable:
+        '''
+        @return perform_action, but recording the grabs and drops
+        '''
+        @functools.wraps(perform_action)
+        def wrapper(agent_id, action_name, action_kwargs):
+            result = perform_action(agent_id, action_name, action_kwargs)
+            if action_name in TRACED_ACTIONS:
+                self._instant(action_name, {'agent': agent_id, 'object': action_kwargs.get('object_id'),
+                                            'succeeded': result.succeeded})
+            return result
+        return wrapper
+
+    def _messages(self, agent_id:str, get_messages:Callable) -> Callable:
+        '''
+        @return get_messages, but recording every message the agent sends
+        '''
+        @functools.wraps(get_messages)
+        def wrapper(*args, **kwargs):
+            messages = get_messages(*args, **kwargs)
+            for message in messages:
+                self._instant('message', {'from': agent_id, 'to': str(message.to_id),
+                                          'content': str(message.content)[:200]})
+            return messages
+        return wrapper
@@ -0,0 +1,141 @@
+'''
+Zygote-style session runner: this process imports and warms up everything
+once, then forks a child for every session. The children start with all
+modules loaded and the world layouts built, shared copy-on-write.
+Needs os.fork, so does not work on Windows.
+
+For comparison, run_fresh runs a session in a new interpreter:
+python -m bw4t.zygote <specfile> <resultfile>
+runs the pickled spec in specfile and pickles the summary to resultfile.
+'''
+from typing import Dict, Iterator, List
+import os
+import pickle
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from bw4t.tournament import runSession, warmUp
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_forked(specs:List[dict], workers:int=1) -> Iterator[dict]:
+    '''
+    Run all given sessions, each in its own child forked from this process.
+    @param specs the session specs to run
+    @param workers max number of children running at the same time
+    @return iterator over the session summaries, in order of completion.
+        Every summary has 'startup': the seconds from the fork until
+        the world of the session was ready to run.
+    '''
+    if not hasattr(os, 'fork'):
+        raise ValueError("Forking sessions needs os.fork, which this platform does not have")
+    warmUp(specs)
+
+    pending = list(reversed(specs))
+    running:Dict[int, dict] = {}  # read end of the pipe -> child info
+    try:
+        while pending or running:
+            while pending and len(running) < max(workers, 1):
+                spec = pending.pop()
+                fd, pid, launched = _fork(spec)
+                running[fd] = {'spec': spec, 'pid': pid, 'launched': launched, 'data': b''}
+
+            readable, _, _ = select.select(list(running.keys()), [], [])
+            for fd in readable:
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    running[fd]['data'] += chunk
+                    continue
+                # end of file: the child is done
+                child = running.pop(fd)
+                os.close(fd)
+                os.waitpid(child['pid'], 0)
+                if not child['data']:
+                    raise RuntimeError(f"Session {child['spec']['index']} failed, see its traceback above")
+                summary = pickle.loads(child['data'])
+                summary['startup'] = summary['ready_at'] - child['launched']
+                yield summary
+    finally:
+        # a session failed or the caller stopped iterating: don't leave zombies and open pipes behind
+        _kill(running)
+
+
+def _kill(running:Dict[int, dict]):
+    '''
+    kill and reap the children that are still running, and close their pipes
+    @param running read end of the pipe -> child info, as in run_forked
+    '''
+    for fd, child in running.items():
+        try:
+            os.kill(child['pid'], signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # already exited, but not reaped yet
+        os.waitpid(child['pid'], 0)
+        os.close(fd)
+    running.clear()
+
+
+def _fork(spec:dict):
+    '''
+    fork a child that runs the spec and writes the pickled summary to a pipe
+    @return read end of the pipe, pid of the child, time of the fork
+    '''
+    read_fd, write_fd = os.pipe()
+    # don't let the child inherit and flush our buffered output
+    sys.stdout.flush()
+    sys.stderr.flush()
+    launched = time.time()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        code = 0
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe:
+                pipe.write(pickle.dumps(runSession(spec)))
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # skip the cleanup of the parent's state
+        os._exit(code)
+    os.close(write_fd)
+    return read_fd, pid, launched
+
+
+def run_fresh(spec:dict) -> dict:
+    '''
+    Run a session in a new python interpreter, that has to import everything itself.
+    @return the summary of the session, with 'startup' the seconds from
+        launching the interpreter until the world was ready to run.
+    '''
+    with tempfile.TemporaryDirectory() as tmp:
+        specfile = os.path.join(tmp, 'spec.pickle')
+        resultfile = os.path.join(tmp, 'result.pickle')
+        with open(specfile, 'wb') as f:
+            pickle.dump(spec, f)
+        # the new interpreter must find our packages, but keep the working dir for the logdir
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [_ROOT, env.get('PYTHONPATH')]))
+        launched = time.time()
+        subprocess.run([sys.executable, '-m', 'bw4t.zygote', specfile, resultfile], env=env, check=True)
+        with open(resultfile, 'rb') as f:
+            summary = pickle.load(f)
+    summary['startup'] = summary['ready_at'] - launched
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        raise ValueError("usage: " + sys.argv[0] + " <specfile> <resultfile>")
+    with open(sys.argv[1], 'rb') as f:
+        spec = pickle.load(f)
+    summary = runSession(spec)
+    with open(sys.argv[2], 'wb') as f:
+        pickle.dump(summary, f)
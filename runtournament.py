@@ -1,15 +1,21 @@
-from itertools import combinations, combinations_with_replacement
+import argparse
 
 from agents1.Team42Agent import Team42Agent
 from agents_cluster.Team13Agent import Team13Agent  # tested
 from agents_cluster.Team33Agent import Team33Agent
 from agents_cluster.team22agent import Team22Agent
-from bw4t.BW4TWorld import BW4TWorld, DEFAULT_WORLDSETTINGS
-from bw4t.statistics import Statistics
+from bw4t.BW4TWorld import DEFAULT_WORLDSETTINGS
+from bw4t.resultstore import ResultStore
+from bw4t.tournament import sessionSpecs, dedupe, fanOut, runSessions, runSequential, aggregate, \
+    maxSuccessHalfwidth
+from bw4t.zygote import run_forked
 
 """
-This runs a single session. You have to log in on localhost:3000 and 
-press the start button in god mode to start the session.
+This runs a tournament: every team of 3 agents plays every solvable
+combination of agent settings. Use --workers to run the sessions
+in parallel worker processes. With --sequential every combination
+runs with more and more seeds until its success rate and ticks are
+known precisely enough.
 """
 
 
@@ -22,6 +28,21 @@ def checkNoDuplicates(names: list):
         raise ValueError(f"Found duplicate agent names {duplicates}!")
 
 
+def report(summaries: list):
+    '''
+    print the results per team and of our agent
+    '''
+    res, our = aggregate(summaries, 'agent42')
+    for data in res:
+        print("=-=-=-=-=-=-=-=-=-=", f"done with team permutation {data['agents']}",
+              "succesrate:", data['success_rate'], "avg ticks", data['avg_ticks'], "stalled:", data['stalled'])
+
+    print("DONE")
+    print(res)
+    print("our success: " + str(our['count']) + '/' + str(our['total']))
+    print('our average tick: ' + str(our['ticks'] / our['count']))
+
+
 if __name__ == "__main__":
     agent_settings = [
         {'slowdown': 1, 'shapeblind': True, 'colourblind': True},
@@ -49,68 +70,105 @@ if __name__ == "__main__":
     settings['deadline'] = 500
     settings['tick_duration'] = 0
     settings['random_seed'] = 1
-
-    res = []
-
-    our_count = 0
-    our_total = 0
-    our_ticks = 0
-
-    for i, team in enumerate(combinations(agents, teamsize)):
-        print(f"Started with team permutation: {team}")
-        successes = 0
-        ticks = 0
-        total = 0
-
-        contains_our = ('agent42' in [t['name'] for t in team])
-
-        # for settingcombi in agent_settings_permutations:
-        for settingcombi in combinations_with_replacement(agent_settings, teamsize):
-            # check if there is at least 1 agent that can see colors and 1 that can see shapes
-            color_visible = False
-            shape_visible = False
-            for setting in settingcombi:
-                if not setting['shapeblind']:
-                    shape_visible = True
-                if not setting['colourblind']:
-                    color_visible = True
-
-            if not (color_visible and shape_visible):
-                continue  # not solvable
-
-            our_total += contains_our
-
-            print(f"-- Started session with sessioncombi {settingcombi}")
-            total += 1
-
-            # assign settings to agents
-            for i, agent in enumerate(team):
-                agent['settings'] = settingcombi[i]
-
-            world = BW4TWorld(list(team), settings).run()
-            stats = Statistics(world.getLogger().getFileName())
-            if stats.isSucces() == 'True':
-                successes += 1
-                our_count += contains_our
-                our_ticks += contains_our * int(stats.getLastTick())
-                ticks += int(stats.getLastTick())
-
-            print("---> results:", "success:", stats.isSucces(), "  ticks:", stats.getLastTick())
-
-        print("=-=-=-=-=-=-=-=-=-=", "done with team permutation {team}", "succesrate:", successes / total, "avg ticks",
-              ticks / total)
-
-        data = {
-            'agents': team,
-            'success_rate': str(successes) + '/' + str(total),
-            'avg_ticks': str(ticks / total),
-        }
-        res.append(data)
-
-    print("DONE")
-    print(res)
-    print("our success: " + str(our_count) + '/' + str(our_total))
-    print('our average tick: ' + str(our_ticks / our_count))
+    # nobody watches a tournament, and parallel workers can not share the web server port
+    settings['headless'] = True
+
+    parser = argparse.ArgumentParser(description="Run a BW4T tournament")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of worker processes, 1 runs all sessions in this process")
+    parser.add_argument('--logdir', default='.', help="directory for the session logs")
+    parser.add_argument('--vary-seed', action='store_true',
+                        help="give every session a different random seed")
+    parser.add_argument('--fork', action='store_true',
+                        help="fork every session from this warmed up process instead of using a process pool")
+    parser.add_argument('--sequential', action='store_true',
+                        help="run every team and settings combination with more seeds, until its results are settled")
+    parser.add_argument('--min-seeds', type=int, default=5, help="minimum seeds per combination with --sequential")
+    parser.add_argument('--max-seeds', type=int, default=20, help="maximum seeds per combination with --sequential")
+    parser.add_argument('--success-halfwidth', type=float, default=0.25,
+                        help="with --sequential, a combination can settle when the half-width of the 95%% interval "
+                             "of its success rate is at most this. Mixed results need about 12 seeds for 0.25, 20 for 0.2")
+    parser.add_argument('--ticks-halfwidth', type=float, default=0.2,
+                        help="with --sequential, a combination can settle when the half-width of the 95%% interval "
+                             "of its mean ticks is at most this fraction of the mean")
+    parser.add_argument('--stall-ticks', type=int, default=None,
+                        help="stop a session when nothing happened for this many ticks")
+    parser.add_argument('--binary-log', action='store_true',
+                        help="write the session logs in the compact binary format instead of csv")
+    parser.add_argument('--store', default=None,
+                        help="sqlite file to record results in. Sessions already recorded there are skipped")
+    args = parser.parse_args()
+    settings['stall_ticks'] = args.stall_ticks
+    settings['log_format'] = 'binary' if args.binary_log else 'csv'
+
+    specs = sessionSpecs(agents, agent_settings, teamsize, settings,
+                         logdir=args.logdir, vary_seed=args.vary_seed)
+    store = ResultStore(args.store) if args.store else None
+    runner = run_forked if args.fork else runSessions
+    startups = []
+    saved = []
+
+    def run(todo: list):
+        '''
+        run the given specs, skipping and recording sessions in the store.
+        Equivalent sessions run only once.
+        @return iterator over the summaries of all given specs
+        '''
+        byindex = {spec['index']: spec for spec in todo}
+        missing = store.missing(todo) if store else todo
+        if store:
+            missing_indices = {spec['index'] for spec in missing}
+            yield from store.summaries([spec for spec in todo if spec['index'] not in missing_indices])
+        distinct, equivalents = dedupe(missing)
+        saved.append(len(missing) - len(distinct))
+        if len(distinct) < len(missing):
+            print(f"Running {len(distinct)} of {len(todo)} sessions with {args.workers} worker(s),",
+                  f"{len(missing) - len(distinct)} equivalent sessions share their result")
+        else:
+            print(f"Running {len(distinct)} of {len(todo)} sessions with {args.workers} worker(s)")
+        for nr, result in enumerate(runner(distinct, workers=args.workers)):
+            if args.fork:
+                startups.append(result['startup'])
+            print(f"---> [{nr + 1}/{len(distinct)}] team {result['team']} settings {result['settings']}",
+                  "seed:", result['seed'], "success:", result['success'], "stalled:", result['stalled'],
+                  "  ticks:", result['ticks'])
+            for summary in fanOut(result, equivalents):
+                if store:
+                    store.add(byindex[summary['index']], summary)
+                yield summary
+
+    if args.sequential:
+        if maxSuccessHalfwidth(args.max_seeds) > args.success_halfwidth:
+            print(f"Warning: combinations with mixed success need more than --max-seeds {args.max_seeds} seeds",
+                  f"to reach --success-halfwidth {args.success_halfwidth},",
+                  f"{args.max_seeds} seeds give {maxSuccessHalfwidth(args.max_seeds):.2f}")
+        cells = runSequential(specs, runner=run, min_seeds=args.min_seeds, max_seeds=args.max_seeds,
+                              success_halfwidth=args.success_halfwidth, ticks_halfwidth=args.ticks_halfwidth)
+        for cell in cells:
+            low, high = cell['success_interval']
+            ticks_low, ticks_high = cell['ticks_interval']
+            print(f"team {cell['team']} settings {cell['settings']}: {cell['samples']} seeds",
+                  f"{'settled' if cell['settled'] else 'capped'},",
+                  f"success {cell['success_rate']:.2f} [{low:.2f}, {high:.2f}],",
+                  f"ticks {cell['mean_ticks']:.1f} [{ticks_low:.1f}, {ticks_high:.1f}],",
+                  f"stalled {cell['stalled']}")
+        print(f"{sum(cell['samples'] for cell in cells)} sessions,",
+              f"at most {len(cells) * args.max_seeds} without early stopping")
+    else:
+        summaries = list(run(specs))
+        report(summaries)
+
+    # teams of different bot classes, as the default ones, never have equivalent sessions
+    if sum(saved) > 0:
+        print(f"{sum(saved)} sessions saved by running equivalent sessions only once")
+    else:
+        print("no equivalent sessions, every session ran")
+    if startups:
+        print(f"session startup: mean {sum(startups) / len(startups):.3f}s, max {max(startups):.3f}s")
+    if store:
+        for stats in store.teamStats():
+            print(stats)
+        store.close()
 
     # with open('tournament.txt', 'w') as outfile:
     #     json.dump(res, outfile)